@@ -0,0 +1,47 @@
+import pygame
+from constants import *
+
+# Piece images are read from disk once, on first use (convert_alpha needs the window to exist),
+# into one atlas: a column per piece, a row per color. Scaled copies of the atlas are kept per cell size,
+# so every blit uses an image that already has the size and the pixel format of the screen.
+
+PIECE_ORDER = "pnbrqk"
+
+atlas = None  # images as they are on disk, [black row, white row]
+atlas_cell = (0, 0)  # size of one image in the atlas
+sprites = {}  # (width, height): {(piece, color): image of that size}
+
+
+def load_atlas():
+    global atlas, atlas_cell
+    images = [[pygame.image.load("Assets//" + ("W" if color else "B") + piece + ".png") for piece in PIECE_ORDER]
+              for color in range(2)]
+    atlas_cell = (max(image.get_width() for row in images for image in row),
+                  max(image.get_height() for row in images for image in row))
+    atlas = pygame.Surface((atlas_cell[0] * len(PIECE_ORDER), atlas_cell[1] * 2), pygame.SRCALPHA).convert_alpha()
+    atlas.fill((0, 0, 0, 0))
+    for color in range(2):
+        for i in range(len(PIECE_ORDER)):
+            atlas.blit(images[color][i], (i * atlas_cell[0], color * atlas_cell[1]))
+
+
+def get_sprites(size=(CELL_WIDTH, CELL_HEIGHT)):  # {(piece, color): image} scaled to size
+    if size not in sprites:
+        if atlas is None:
+            load_atlas()
+
+        width, height = size
+        scaled = pygame.Surface((width * len(PIECE_ORDER), height * 2), pygame.SRCALPHA).convert_alpha()
+        scaled.fill((0, 0, 0, 0))
+        sprites[size] = {}
+        for color in range(2):
+            for i in range(len(PIECE_ORDER)):
+                # every image is scaled on its own, so its neighbours in the atlas don't bleed into its edges
+                image = atlas.subsurface((i * atlas_cell[0], color * atlas_cell[1], atlas_cell[0], atlas_cell[1]))
+                scaled.blit(pygame.transform.smoothscale(image, size), (i * width, color * height))
+                sprites[size][PIECE_ORDER[i], color] = scaled.subsurface((i * width, color * height, width, height))
+    return sprites[size]
+
+
+def get_sprite(piece, color, size=(CELL_WIDTH, CELL_HEIGHT)):
+    return get_sprites(size)[piece, color]
@@ -0,0 +1,76 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from search import *
+from fen import *
+
+# Analyses a file of FEN positions (one per line) on every core. Results are printed tab separated
+# as soon as a worker finishes a position, so they come out of order; the first column is the line number.
+
+table = None  # every worker process keeps its own transposition table between positions
+
+
+def init_worker(table_size):
+    global table
+    table = TranspositionTable(table_size)
+
+
+def get_status(position):
+    in_check = position.is_check(int(position.turn))
+    if not position.has_legal_move():
+        return "checkmate" if in_check else "stalemate"
+    return "check" if in_check else "-"
+
+
+def analyse(job):
+    index, fen, depth = job
+    try:
+        return analyse_position(index, fen, depth)
+    except Exception as error:  # one bad line gets an error row, the positions still pending are not lost
+        return [index, fen, "-", "error: " + (str(error) or type(error).__name__), "-", "-", 0]
+
+
+def analyse_position(index, fen, depth):
+    position = position_from_fen(fen)
+    result = [index, fen, len(position.legal_moves()), get_status(position), "-", "-", 0]
+    if depth and position.legal_moves():
+        search = Search(position, time_limit=float("inf"), max_depth=depth, table=table)
+        result[4] = move_name(search.iterative_deepening())
+        result[5] = search.best_score
+        result[6] = search.nodes
+    return result
+
+
+def read_positions(path):
+    with open(path) as file:
+        for index, line in enumerate(file, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield index, line
+
+
+def run(path, depth, workers, table_size, chunk_size=1, output=sys.stdout):
+    jobs = [(index, fen, depth) for index, fen in read_positions(path)]
+    start_time = time.time()
+    nodes = 0
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(table_size,)) as pool:
+        for result in pool.imap_unordered(analyse, jobs, chunk_size):
+            nodes += result[6]
+            print("\t".join(str(value) for value in result), file=output, flush=True)
+
+    elapsed = time.time() - start_time
+    print("positions", len(jobs), "workers", workers, "time", round(elapsed, 2),
+          "positions/s", round(len(jobs) / elapsed, 1) if elapsed else 0, "nodes", nodes, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Legal move count, status and best move for a file of FEN positions")
+    parser.add_argument("path", help="file with one FEN per line, # starts a comment")
+    parser.add_argument("--depth", type=int, default=3, help="search depth for the best move, 0 skips the search")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size of every worker in megabytes")
+    parser.add_argument("--chunk", type=int, default=1, help="positions handed to a worker at once")
+    args = parser.parse_args()
+
+    run(args.path, args.depth, args.workers, args.hash, args.chunk)
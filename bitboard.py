@@ -0,0 +1,287 @@
+from engine import *
+
+# Bitboard backend for the engine. Bit n of a bitboard is square n (see utilities.to_square),
+# so bit 0 is the top left corner of the board and bit 63 the bottom right one.
+
+DIRECTIONS = BISHOP_DIRECTIONS + ROOK_DIRECTIONS
+# rays going towards bigger squares are cut at their lowest blocker, the others at their highest one
+POSITIVE_DIRECTIONS = [dy * COLS + dx > 0 for dx, dy in DIRECTIONS]
+
+DOUBLE_PUSH_ROWS = [0xFF << 24,  # black pawns land on row 3
+                    0xFF << 32]  # white pawns land on row 4
+NOT_FILE_A = ~sum(1 << (y * COLS) for y in range(ROWS)) & (1 << ROWS * COLS) - 1
+NOT_FILE_H = ~sum(1 << (y * COLS + COLS - 1) for y in range(ROWS)) & (1 << ROWS * COLS) - 1
+
+
+def to_mask(squares):
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
+
+
+def iter_bits(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+KNIGHT_ATTACK_MASKS = [to_mask(targets) for targets in KNIGHT_TARGETS]
+KING_ATTACK_MASKS = [to_mask(targets) for targets in KING_TARGETS]
+PAWN_ATTACK_MASKS = [[to_mask(targets) for targets in PAWN_ATTACKS[color]] for color in range(2)]
+# RAY_MASKS[direction][square] - every square from square to the edge of the board
+RAY_MASKS = [[to_mask(rays[direction]) for rays in calc_rays(DIRECTIONS)] for direction in range(len(DIRECTIONS))]
+# every square a bishop or a rook would reach from square on an empty board
+BISHOP_LINE_MASKS = [to_mask(sum(rays, [])) for rays in BISHOP_RAYS]
+ROOK_LINE_MASKS = [to_mask(sum(rays, [])) for rays in ROOK_RAYS]
+BETWEEN_MASKS = [[to_mask(squares) for squares in row] for row in BETWEEN]
+
+
+def slider_attacks(square, occupied, directions):
+    attacks = 0
+    for direction in directions:
+        ray = RAY_MASKS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if POSITIVE_DIRECTIONS[direction]:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAY_MASKS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def calc_line_attacks(directions):
+    # LINE_MASKS[square] - the line through square, LINE_ATTACKS[square][blockers on it] - attacks along it,
+    # so a slider on a line costs one lookup instead of a walk per direction
+    masks = []
+    attacks = []
+    for square in range(ROWS * COLS):
+        mask = RAY_MASKS[directions[0]][square] | RAY_MASKS[directions[1]][square]
+        squares = list(iter_bits(mask))
+        table = {}
+        for subset in range(1 << len(squares)):
+            blockers = to_mask(squares[i] for i in range(len(squares)) if subset >> i & 1)
+            table[blockers] = slider_attacks(square, blockers, directions)
+        masks.append(mask)
+        attacks.append(table)
+    return masks, attacks
+
+
+# (mask, attacks) of both diagonals, of the rank and of the file
+LINES = [calc_line_attacks((0, 3)), calc_line_attacks((1, 2)), calc_line_attacks((4, 5)), calc_line_attacks((6, 7))]
+[DIAGONAL_MASKS, DIAGONAL_ATTACKS], [ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_ATTACKS], [RANK_MASKS, RANK_ATTACKS], \
+    [FILE_MASKS, FILE_ATTACKS] = LINES
+
+
+def bishop_attacks(square, occupied):
+    return DIAGONAL_ATTACKS[square][occupied & DIAGONAL_MASKS[square]] | \
+        ANTI_DIAGONAL_ATTACKS[square][occupied & ANTI_DIAGONAL_MASKS[square]]
+
+
+def rook_attacks(square, occupied):
+    return RANK_ATTACKS[square][occupied & RANK_MASKS[square]] | FILE_ATTACKS[square][occupied & FILE_MASKS[square]]
+
+
+class BitboardPosition(Position):
+    def __init__(self):
+        self.bitboards = [{piece: 0 for piece in "pnbrqk"} for color in range(2)]  # [black, white]
+        self.occupancy = [0, 0]  # all black pieces, all white pieces
+        Position.__init__(self)
+
+    def set_piece(self, square, piece, color):
+        bit = 1 << square
+        if self.pieces[square]:
+            self.bitboards[self.colors[square]][self.pieces[square]] ^= bit
+            self.occupancy[self.colors[square]] ^= bit
+        if piece:
+            self.bitboards[color][piece] |= bit
+            self.occupancy[color] |= bit
+        Position.set_piece(self, square, piece, color)
+
+    def get_king_pos(self, color):
+        return self.bitboards[color]["k"].bit_length() - 1
+
+    def get_attacks_mask(self, square):
+        piece = self.pieces[square]
+        if piece == "p":
+            return PAWN_ATTACK_MASKS[self.colors[square]][square]
+        if piece == "n":
+            return KNIGHT_ATTACK_MASKS[square]
+        if piece == "k":
+            return KING_ATTACK_MASKS[square]
+
+        occupied = self.occupancy[0] | self.occupancy[1]
+        if piece == "b":
+            return bishop_attacks(square, occupied)
+        if piece == "r":
+            return rook_attacks(square, occupied)
+        return bishop_attacks(square, occupied) | rook_attacks(square, occupied)
+
+    def get_attacks(self, square):
+        return list(iter_bits(self.get_attacks_mask(square)))
+
+    def get_attack_map(self, color):
+        if self.attack_maps[color] is None:
+            attack_map = 0
+            for start in iter_bits(self.occupancy[color]):
+                attack_map |= self.get_attacks_mask(start)
+            self.attack_maps[color] = attack_map
+        return self.attack_maps[color]
+
+    def is_attacked(self, color, square, hidden=None):
+        boards = self.bitboards[color]
+        occupied = self.occupancy[0] | self.occupancy[1]
+        if hidden is not None:
+            occupied &= ~(1 << hidden)
+        return bool(PAWN_ATTACK_MASKS[1 - color][square] & boards["p"] or
+                    KNIGHT_ATTACK_MASKS[square] & boards["n"] or
+                    KING_ATTACK_MASKS[square] & boards["k"] or
+                    bishop_attacks(square, occupied) & (boards["b"] | boards["q"]) or
+                    rook_attacks(square, occupied) & (boards["r"] | boards["q"]))
+
+    def get_checks_and_pins(self, color):  # checking squares and {pinned square: mask of squares it can move to}
+        king = self.get_king_pos(color)
+        enemy = self.bitboards[1 - color]
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[1 - color]
+        checkers = PAWN_ATTACK_MASKS[color][king] & enemy["p"] | KNIGHT_ATTACK_MASKS[king] & enemy["n"]
+
+        pins = {}
+        for lines, sliders in ((BISHOP_LINE_MASKS, enemy["b"] | enemy["q"]), (ROOK_LINE_MASKS, enemy["r"] | enemy["q"])):
+            # a slider on a line of the king checks with nothing between, pins with one own piece between
+            for start in iter_bits(lines[king] & sliders):
+                between = BETWEEN_MASKS[king][start]
+                blockers = between & occupied
+                if not blockers:
+                    checkers |= 1 << start
+                elif blockers & (blockers - 1) == 0 and blockers & own:
+                    pins[blockers.bit_length() - 1] = between | 1 << start
+        return list(iter_bits(checkers)), pins
+
+    def get_escape_mask(self, color):  # squares the king can step to without being attacked
+        king = self.get_king_pos(color)
+        escapes = 0
+        for end in iter_bits(KING_ATTACK_MASKS[king] & ~self.occupancy[color]):
+            if not self.is_attacked(1 - color, end, king):
+                escapes |= 1 << end
+        return escapes
+
+    def filter_legal(self, moves, checks):  # same rules as Position.filter_legal, tested with masks
+        checkers, pins = checks
+        color = int(self.turn)
+        king = self.get_king_pos(color)
+        targets = BETWEEN_MASKS[king][checkers[0]] | 1 << checkers[0] if len(checkers) == 1 else -1  # -1 - any square
+        escapes = None
+        legal = []
+        for move in moves:
+            start = move & 63
+            end = 1 << (move >> 6 & 63)
+            if start == king:
+                if move & CASTLE:
+                    legal.append(move)
+                else:
+                    if escapes is None:
+                        escapes = self.get_escape_mask(color)
+                    if escapes & end:
+                        legal.append(move)
+            elif len(checkers) > 1:
+                continue
+            elif move & EN_PASSANT:
+                if self.is_legal(move):
+                    legal.append(move)
+            elif targets & end and pins.get(start, -1) & end:
+                legal.append(move)
+        return legal
+
+    def add_mask_moves(self, start, quiet, captures, moves):
+        while quiet:
+            end = quiet & -quiet
+            moves.append(start | (end.bit_length() - 1) << 6)
+            quiet ^= end
+        while captures:
+            end = captures & -captures
+            moves.append(start | (end.bit_length() - 1) << 6 | CAPTURE)
+            captures ^= end
+
+    def generate_legal_moves(self):  # checks and pins cut the target masks, so no move is made and then dropped
+        color = int(self.turn)
+        checkers, pins = self.get_checks_and_pins(color)
+        king = self.get_king_pos(color)
+        own = self.occupancy[color]
+        enemy = self.occupancy[1 - color]
+        empty = ~(own | enemy)
+        moves = []
+
+        escapes = self.get_escape_mask(color)
+        self.add_mask_moves(king, escapes & empty, escapes & enemy, moves)
+        if len(checkers) > 1:  # double check, only the king can move
+            return moves
+        # in check every other piece has to take the checker or block its line, -1 - any square
+        targets = BETWEEN_MASKS[king][checkers[0]] | 1 << checkers[0] if checkers else -1
+
+        # pinned pieces are few, their moves are made one by one and kept on the pin line
+        pinned = 0
+        for start in pins:
+            pinned |= 1 << start
+            allowed = targets & pins[start]
+            candidates = []
+            self.add_piece_moves(start, color, candidates)
+            for move in candidates:
+                if move & EN_PASSANT:
+                    if self.is_legal(move):
+                        moves.append(move)
+                elif allowed >> (move >> 6 & 63) & 1:
+                    moves.append(move)
+
+        # the other pawns are pushed all at once
+        pawns = self.bitboards[color]["p"] & ~pinned
+        forward = -COLS if color else COLS
+        if color:
+            single = pawns >> COLS & empty
+            double = single >> COLS & empty & DOUBLE_PUSH_ROWS[color]
+        else:
+            single = pawns << COLS & empty
+            double = single << COLS & empty & DOUBLE_PUSH_ROWS[color]
+
+        for end in iter_bits(single & targets):
+            self.add_pawn_move(end - forward | end << 6, moves)
+        for end in iter_bits(double & targets):
+            moves.append(end - 2 * forward | end << 6 | DOUBLE_PUSH)
+
+        # captures towards the a file and towards the h file, every pawn at once
+        if color:
+            sides = ((pawns & NOT_FILE_A) >> COLS + 1, COLS + 1), ((pawns & NOT_FILE_H) >> COLS - 1, COLS - 1)
+        else:
+            sides = ((pawns & NOT_FILE_A) << COLS - 1, -COLS + 1), ((pawns & NOT_FILE_H) << COLS + 1, -COLS - 1)
+        for attacks, back in sides:
+            for end in iter_bits(attacks & enemy & targets):
+                self.add_pawn_move(end + back | end << 6 | CAPTURE, moves)
+            if self.en_passant is not None and attacks >> self.en_passant & 1:
+                move = self.en_passant + back | self.en_passant << 6 | CAPTURE | EN_PASSANT
+                if self.is_legal(move):  # both pawns leave the row at once, so it is tried on the board
+                    moves.append(move)
+
+        pieces = own & ~pinned & ~self.bitboards[color]["p"] & ~(1 << king)
+        while pieces:
+            start = pieces & -pieces
+            pieces ^= start
+            start = start.bit_length() - 1
+            attacks = self.get_attacks_mask(start) & targets
+            self.add_mask_moves(start, attacks & empty, attacks & enemy, moves)
+
+        if not checkers:
+            self.add_castling_moves(color, moves)
+        return moves
+
+    def add_castling_moves(self, color, moves):  # only the squares the king crosses are looked at, no attack map
+        # the king is not in check, generate_legal_moves only calls this without checkers
+        castle = self.get_castle_options(color)
+        for i in range(2):
+            king_start, king_end, rook_start, rook_end, empty, safe = CASTLING[color][i]
+            if castle[i] and self.pieces[rook_start] == "r" and self.colors[rook_start] == color and \
+                    not any(self.pieces[square] for square in empty) and \
+                    not any(self.is_attacked(1 - color, square) for square in safe):
+                moves.append(king_start | king_end << 6 | CASTLE)
@@ -1,38 +1,9 @@
 import pygame
-from copy import deepcopy
-from utilities import *
+import sys
+from worker import *
+from fen import *
 from gui import *
-
-pygame.init()
-
-
-
-win = pygame.display.set_mode((WIDTH, HEIGHT))
-
-clock = pygame.time.Clock()
-
-pygame.display.set_caption("Chess")
-
-Bp = pygame.image.load("Assets//Bp.png")
-Wp = pygame.image.load("Assets//Wp.png")
-Bb = pygame.image.load("Assets//Bb.png")
-Wb = pygame.image.load("Assets//Wb.png")
-Bn = pygame.image.load("Assets//Bn.png")
-Wn = pygame.image.load("Assets//Wn.png")
-Br = pygame.image.load("Assets//Br.png")
-Wr = pygame.image.load("Assets//Wr.png")
-Bq = pygame.image.load("Assets//Bq.png")
-Wq = pygame.image.load("Assets//Wq.png")
-Bk = pygame.image.load("Assets//Bk.png")
-Wk = pygame.image.load("Assets//Wk.png")
-
-piece_pictures = {"p": [Bp, Wp],
-                  "b": [Bb, Wb],
-                  "n": [Bn, Wn],
-                  "r": [Br, Wr],
-                  "q": [Bq, Wq],
-                  "k": [Bk, Wk],
-                  }
+from assets import *
 
 class Promotion_menu():
     def __init__(self, color):
@@ -45,6 +16,7 @@ class Promotion_menu():
         self.cell_width = self.width // 2 - self.border
         self.cell_height = self.height // 2 - self.border
         self.visible = False
+        self.dirty = False  # shown or hidden since the last frame
 
         self.buttons_init(color)
 
@@ -52,43 +24,47 @@ class Promotion_menu():
         self.color = color
         self.queen_button = Promotion_button(win,
                                              (self.border + self.x, self.border + self.y),
-                                             piece_pictures["q"][color],
+                                             get_sprite("q", color, (self.cell_width, self.cell_height)),
                                              "q",
                                              size=(self.cell_width, self.cell_height))
         self.knight_button = Promotion_button(win,
                                               (self.border + self.x + self.cell_width, self.border + self.y),
-                                              piece_pictures["n"][color],
+                                              get_sprite("n", color, (self.cell_width, self.cell_height)),
                                               "n",
                                               size=(self.cell_width, self.cell_height))
         self.rook_button = Promotion_button(win,
                                             (self.border + self.x, self.border + self.y + self.cell_height),
-                                            piece_pictures["r"][color],
+                                            get_sprite("r", color, (self.cell_width, self.cell_height)),
                                             "r",
                                             size=(self.cell_width, self.cell_height))
         self.bishop_button = Promotion_button(win,
                                               (self.border + self.x + self.cell_width,
                                                self.border + self.y + self.cell_height),
-                                              piece_pictures["b"][color],
+                                              get_sprite("b", color, (self.cell_width, self.cell_height)),
                                               "b",
                                               size=(self.cell_width, self.cell_height))
 
         self.buttons = [self.queen_button, self.knight_button, self.rook_button, self.bishop_button]
 
     def draw(self):
-        if self.visible:
-            pygame.draw.rect(win, (255, 255, 255), (self.x, self.y, self.width, self.height))
-            for i in self.buttons:
-                i.draw()
-                i.enabled = True
-                if i.onClick():
-                    board[promotion_coords[0]][promotion_coords[1]].piece = i.value
-                    board[promotion_coords[0]][promotion_coords[1]].piece_color = self.color
-                    self.visible = False
-                    game.enabled = True
+        pygame.draw.rect(win, (255, 255, 255), (self.x, self.y, self.width, self.height))
+        for i in self.buttons:
+            i.draw()
 
-        else:
-            for i in self.buttons:
-                i.enabled = False
+    def event_handler(self, event):
+        for i in self.buttons:
+            i.event_handler(event)
+
+    def get_choice(self):  # piece of the button clicked this frame, None if there was no click
+        for i in self.buttons:
+            if i.onClick():
+                return i.value
+
+    def set_visible(self, value):
+        self.visible = value
+        self.dirty = True
+        for i in self.buttons:
+            i.enabled = value
 
 class Promotion_button(Box):
     def __init__(self, win, pos, image, value, size=(120, 25)):
@@ -102,34 +78,37 @@ class Promotion_button(Box):
         win.blit(self.image, (self.x, self.y))
 
 
-class Game():
+class Game(Position):
     def __init__(self):
-        self.white_castle = [1, 1]  # left digit - long castle, right digit - short castle
-        self.black_castle = [1, 1]  # left digit - long castle, right digit - short castle
-        self.turn = True  # True - white, False - black
+        Position.__init__(self)
         self.enabled = True
+        self.redo_moves = []  # moves taken back, the next one to play again is the last
 
-    def switch_turn(self):
-        self.turn = not self.turn
+    def play(self, move):  # a new move starts a new line, the moves taken back are forgotten
+        self.make_move(move)
+        self.redo_moves = []
 
-    def get_turn(self):
-        return self.turn
+    def undo(self):  # reverses the last move from its undo record
+        if self.history:
+            self.redo_moves.append(self.history[-1][0])
+            self.unmake_move()
 
-    def get_castle_options(self, color):
-        return self.white_castle if color else self.black_castle
+    def redo(self):
+        if self.redo_moves:
+            self.make_move(self.redo_moves.pop())
 
-    def forbid_castling(self, value, color): # value: 0 - long castle, 1 - short castle, 2 - both
-        if color:
-            if value == 2:
-                self.white_castle = [0,0]
-            else:
-                self.white_castle[value] = 0
+    def get_ply(self):
+        return len(self.history)
 
-        else:
-            if value == 2:
-                self.black_castle = [0,0]
-            else:
-                self.black_castle[value] = 0
+    def get_last_ply(self):  # ply at the end of the game, after every move taken back is replayed
+        return len(self.history) + len(self.redo_moves)
+
+    def go_to_ply(self, ply):  # one undo or redo per ply in between, nothing is replayed from the start
+        ply = max(0, min(ply, self.get_last_ply()))
+        while len(self.history) > ply:
+            self.undo()
+        while len(self.history) < ply:
+            self.redo()
 
     def enable(self):
         self.enabled = True
@@ -142,94 +121,65 @@ class Game():
 
 
 class Cell():
+    __slots__ = ("x", "y", "color", "piece_color", "piece", "tag_color",
+                 "possible_moves", "possible_kills", "possible_castle", "dirty")
+
     def __init__(self, x, y, color):
         self.x = x
         self.y = y
         self.color = color
         self.piece_color = 0
         self.piece = ""  # b - bishop, n - knight, p - pawn, k - king, q - queen, r - rook
-        self.clickFlag = False
         self.tag_color = (0, 0, 0)
-        self.possible_moves = []
-        self.possible_kills = []
-        self.possible_castle = []
+        self.possible_moves = set()  # target squares of the piece, filled by calc_moves
+        self.possible_kills = set()
+        self.possible_castle = set()
+        self.dirty = True  # drawn on the next frame, set whenever the piece or the tag color changes
 
-    def draw(self):
-        if self.tag_color == (0, 0, 0):
-
-            pygame.draw.rect(win,
-                             BLACK_CELL_COLOR if self.color == 0 else WHITE_CELL_COLOR,
-                             (self.x * (CELL_WIDTH + BORDER),
-                              self.y * (CELL_HEIGHT + BORDER),
-                              CELL_WIDTH,
-                              CELL_HEIGHT))
-        else:
-            pygame.draw.rect(win,
-                             self.tag_color,
-                             (self.x * (CELL_WIDTH + BORDER),
-                              self.y * (CELL_HEIGHT + BORDER),
-                              CELL_WIDTH,
-                              CELL_HEIGHT))
+    def draw(self):  # the square is copied from the cached board, its highlight from the overlay
+        rect = self.get_rect()
+        win.blit(board_surface, rect, rect)
+        if self.tag_color != (0, 0, 0):
+            win.blit(highlight_overlay, rect, rect)
 
         if self.piece:
-            image = piece_pictures[self.piece][0] if self.piece_color == 0 else piece_pictures[self.piece][1]
-            win.blit(image, (self.x * (CELL_WIDTH + BORDER), self.y * (CELL_HEIGHT + BORDER)))
+            win.blit(get_sprite(self.piece, self.piece_color),
+                     (self.x * (CELL_WIDTH + BORDER), self.y * (CELL_HEIGHT + BORDER)))
+
+    def get_rect(self):
+        return pygame.Rect(self.x * (CELL_WIDTH + BORDER), self.y * (CELL_HEIGHT + BORDER), CELL_WIDTH, CELL_HEIGHT)
 
     def set_piece(self, piece, piece_color):
+        if piece != self.piece or piece_color != self.piece_color:
+            self.dirty = True
         self.piece = piece
         self.piece_color = piece_color
 
     def set_tag_color(self, color):
+        global highlights_changed
         if color == (0, 0, 120):
-            self.tag_color = POSSIBLE_MOVE_COLOR_WHITE if self.color else POSSIBLE_MOVE_COLOR_BLACK
+            color = POSSIBLE_MOVE_COLOR_WHITE if self.color else POSSIBLE_MOVE_COLOR_BLACK
         elif color == (120, 0, 0):
-            self.tag_color = POSSIBLE_KILL_COLOR_BLACK
-        else:
-            self.tag_color = color
+            color = POSSIBLE_KILL_COLOR_BLACK
+        if color != self.tag_color:
+            self.dirty = True
+            highlights_changed = True
+        self.tag_color = color
 
     def reset_tag_color(self):
-        self.tag_color = (0, 0, 0)
-
-    def on_click(self):
-        mouse_x = pygame.mouse.get_pos()[0]
-        mouse_y = pygame.mouse.get_pos()[1]
-        if (pygame.mouse.get_pressed(3)[0] and
-                mouse_x > self.x * (CELL_WIDTH + BORDER) and
-                mouse_x < self.x * (CELL_WIDTH + BORDER) + CELL_WIDTH and
-                mouse_y > self.y * (CELL_HEIGHT + BORDER) and
-                mouse_y < self.y * (CELL_HEIGHT + BORDER) + CELL_HEIGHT):
-            self.clickFlag = True
-
-        if not (pygame.mouse.get_pressed(3)[0] and
-                mouse_x > self.x * (CELL_WIDTH + BORDER) and
-                mouse_x < self.x * (CELL_WIDTH + BORDER) + CELL_WIDTH and
-                mouse_y > self.y * (CELL_HEIGHT + BORDER) and
-                mouse_y < self.y * (CELL_HEIGHT + BORDER) + CELL_HEIGHT):
-            if self.clickFlag == True:
-                self.clickFlag = False
-                return True
-
-    def calc_possible_moves(self, board):
-        if self.piece:
-            if self.piece == "p":
-                self.pawn_exec(board)
-            elif self.piece == "n":
-                self.knight_exec(board)
-            elif self.piece == "b":
-                self.bishop_exec(board)
-            elif self.piece == "r":
-                self.rook_exec(board)
-            elif self.piece == "q":
-                self.queen_exec(board)
-            elif self.piece == "k":
-                self.king_exec(board)
-                if get_king_pos(board, self.piece_color) == [get_chosen().x, get_chosen().y]: # castling
-                    self.possible_castle = self.castle_to_coords(self.check_castling())
-
-        else:
-            self.possible_kills = []
-            self.possible_moves = []
-            self.possible_castle = []
+        self.set_tag_color((0, 0, 0))
+
+    def calc_moves(self, position):
+        self.possible_moves = set()
+        self.possible_kills = set()
+        self.possible_castle = set()
+        for move in position.get_moves_from(to_square(self.x, self.y)):
+            if position.is_castling(move):
+                self.possible_castle.add(move_end(move))
+            elif position.is_capture(move):  # every promotion lands on the same square, the piece comes from the menu
+                self.possible_kills.add(move_end(move))
+            else:
+                self.possible_moves.add(move_end(move))
 
     def __repr__(self):
         if self.piece:
@@ -237,655 +187,6 @@ class Cell():
         else:
             return ""
 
-    def remove_impossible_moves(self, board):
-        for i in self.possible_moves + self.possible_kills:
-
-            temp_board = deepcopy(board)
-            temp_board[i[0]][i[1]].piece = self.piece
-            temp_board[self.x][self.y].piece = ""
-            temp_board[i[0]][i[1]].piece_color = self.piece_color
-
-            if is_check(temp_board, self.piece_color):
-                if i in self.possible_moves:
-                    self.possible_moves.remove(i)
-                else:
-                    self.possible_kills.remove(i)
-
-    def calc_moves(self, board):
-        self.calc_possible_moves(board)
-        self.remove_impossible_moves(board)
-
-    def pawn_exec(self, board):
-        self.possible_moves = []
-        self.possible_kills = []
-        if self.piece_color:  # if white
-            if self.y > 0:
-                # moving forward
-                if not board[self.x][self.y - 1].piece:  # check 1 square up
-                    self.possible_moves.append([self.x, self.y - 1])
-                    if self.y == 6:
-                        if not board[self.x][self.y - 2].piece:  # check 2 square up
-                            self.possible_moves.append([self.x, self.y - 2])
-                # taking left
-                if self.x > 0:
-                    if board[self.x - 1][self.y - 1].piece and board[self.x - 1][self.y - 1].piece_color == 0:
-                        self.possible_kills.append([self.x - 1, self.y - 1])
-
-                # taking right
-                if self.x < COLS - 1:
-                    if board[self.x + 1][self.y - 1].piece and board[self.x + 1][self.y - 1].piece_color == 0:
-                        self.possible_kills.append([self.x + 1, self.y - 1])
-
-
-        else:  # black pawn
-            # moving forward
-            if self.y < 7:
-                if not board[self.x][self.y + 1].piece:  # check 1 square down
-                    self.possible_moves.append([self.x, self.y + 1])
-                    if self.y == 1:
-                        if not board[self.x][self.y + 2].piece:  # check 2 square down
-                            self.possible_moves.append([self.x, self.y + 2])
-
-                # taking left
-                if self.x < COLS - 1:
-                    if board[self.x + 1][self.y + 1].piece and board[self.x + 1][self.y + 1].piece_color == 1:
-                        self.possible_kills.append([self.x + 1, self.y + 1])
-
-                # taking right
-                if self.x > 0:
-                    if board[self.x - 1][self.y + 1].piece and board[self.x - 1][self.y + 1].piece_color == 1:
-                        self.possible_kills.append([self.x - 1, self.y + 1])
-
-    def knight_exec(self, board):
-        self.possible_moves = []
-        self.possible_kills = []
-        # left down corner
-        if self.x >= 1 and self.y <= 5:
-            if board[self.x - 1][self.y + 2].piece:
-                if board[self.x - 1][self.y + 2].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 1, self.y + 2])
-
-            else:
-                self.possible_moves.append([self.x - 1, self.y + 2])
-        if self.x >= 2 and self.y <= 6:
-            if board[self.x - 2][self.y + 1].piece:
-                if board[self.x - 2][self.y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 2, self.y + 1])
-
-            else:
-                self.possible_moves.append([self.x - 2, self.y + 1])
-
-        # left up corner
-        if self.x >= 1 and self.y >= 2:
-            if board[self.x - 1][self.y - 2].piece:
-                if board[self.x - 1][self.y - 2].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 1, self.y - 2])
-
-            else:
-                self.possible_moves.append([self.x - 1, self.y - 2])
-
-        if self.x >= 2 and self.y >= 1:
-            if board[self.x - 2][self.y - 1].piece:
-                if board[self.x - 2][self.y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 2, self.y - 1])
-
-            else:
-                self.possible_moves.append([self.x - 2, self.y - 1])
-
-        # right up corner
-        if self.x <= 5 and self.y >= 1:
-            if board[self.x + 2][self.y - 1].piece:
-                if board[self.x + 2][self.y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 2, self.y - 1])
-
-            else:
-                self.possible_moves.append([self.x + 2, self.y - 1])
-
-        if self.x <= 6 and self.y >= 2:
-            if board[self.x + 1][self.y - 2].piece:
-                if board[self.x + 1][self.y - 2].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 1, self.y - 2])
-
-            else:
-                self.possible_moves.append([self.x + 1, self.y - 2])
-
-        # right down corner
-        if self.x <= 6 and self.y <= 5:
-            if board[self.x + 1][self.y + 2].piece:
-                if board[self.x + 1][self.y + 2].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 1, self.y + 2])
-
-            else:
-                self.possible_moves.append([self.x + 1, self.y + 2])
-
-        if self.x <= 5 and self.y <= 6:
-            if board[self.x + 2][self.y + 1].piece:
-                if board[self.x + 2][self.y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 2, self.y + 1])
-
-            else:
-                self.possible_moves.append([self.x + 2, self.y + 1])
-
-    def bishop_exec(self, board):
-        self.possible_moves = []
-        self.possible_kills = []
-
-        x = self.x
-        y = self.y
-
-        # left up
-        if not (x <= 0 or y <= 0):
-            while not board[x - 1][y - 1].piece and x != 0 and y != 0:
-                self.possible_moves.append([x - 1, y - 1])
-                if x >= 2 and y >= 2:
-                    if board[x - 2][y - 2].piece and board[x - 2][y - 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x - 2, y - 2])
-                x -= 1
-                y -= 1
-
-            # kill check if close
-            if x >= 1 and y >= 1:
-                if board[x - 1][y - 1].piece and board[x - 1][y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x - 1, y - 1])
-
-        x = self.x
-        y = self.y
-
-        # right up
-        if not (x >= 7 or y <= 0):
-            while not board[x + 1][y - 1].piece and x != 7 and y != 0:
-                self.possible_moves.append([x + 1, y - 1])
-                if x <= 5 and y >= 2:
-                    if board[x + 2][y - 2].piece and board[x + 2][y - 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x + 2, y - 2])
-
-                if x >= 6:
-                    break
-                x += 1
-                y -= 1
-
-            # kill check if close
-            if x <= 6 and y >= 1:
-                if board[x + 1][y - 1].piece and board[x + 1][y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x + 1, y - 1])
-
-        x = self.x
-        y = self.y
-
-        # right down
-        if not (x >= 7 or y >= 7):
-            while not board[x + 1][y + 1].piece and x != 7 and y != 7:
-                self.possible_moves.append([x + 1, y + 1])
-                if x <= 5 and y <= 5:
-                    if board[x + 2][y + 2].piece and board[x + 2][y + 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x + 2, y + 2])
-
-                if x >= 6 or y >= 6:
-                    break
-                x += 1
-                y += 1
-
-            # kill check if close
-            if x <= 6 and y <= 6:
-                if board[x + 1][y + 1].piece and board[x + 1][y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x + 1, y + 1])
-
-        x = self.x
-        y = self.y
-
-        # left down
-        if not (x <= 0 or y >= 7):
-
-            while not board[x - 1][y + 1].piece and x != 0 and y != 7:
-
-                self.possible_moves.append([x - 1, y + 1])
-                if x >= 2 and y <= 5:
-
-                    if board[x - 2][y + 2].piece and board[x - 2][y + 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x - 2, y + 2])
-
-                if y >= 6:
-                    break
-                x -= 1
-                y += 1
-
-            # kill check if close
-            if x >= 1 and y <= 6:
-                if board[x - 1][y + 1].piece and board[x - 1][y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x - 1, y + 1])
-
-    def rook_exec(self, board):
-
-        self.possible_moves = []
-        self.possible_kills = []
-
-        x = self.x
-        y = self.y
-
-        # up
-        if y > 0:
-            while not board[x][y - 1].piece and y != 0:
-                self.possible_moves.append([x, y - 1])
-                if y >= 2:
-                    if board[x][y - 2].piece and board[x][y - 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x, y - 2])
-
-                y -= 1
-
-            # kill check if close
-            if y >= 1:
-                if board[x][y - 1].piece and board[x][y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x, y - 1])
-
-        x = self.x
-        y = self.y
-
-        # right
-        if x < 7:
-
-            while not board[x + 1][y].piece and x != 7:
-
-                self.possible_moves.append([x + 1, y])
-                if x <= 5:
-                    if board[x + 2][y].piece and board[x + 2][y].piece_color != self.piece_color:
-                        self.possible_kills.append([x + 2, y])
-
-                if x >= 6:
-                    break
-                x += 1
-
-            # kill check if close
-            if x <= 6:
-                if board[x + 1][y].piece and board[x + 1][y].piece_color != self.piece_color:
-                    self.possible_kills.append([x + 1, y])
-
-        x = self.x
-        y = self.y
-
-        # down
-        if y < 7:
-            while not board[x][y + 1].piece and y != 7:
-                self.possible_moves.append([x, y + 1])
-                if y <= 5:
-                    if board[x][y + 2].piece and board[x][y + 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x, y + 2])
-
-                if y >= 6:
-                    break
-                y += 1
-
-            # kill check if close
-            if y <= 6:
-                if board[x][y + 1].piece and board[x][y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x, y + 1])
-
-        x = self.x
-        y = self.y
-
-        # left
-
-        if x > 0:
-
-            while not board[x - 1][y].piece and x != 0:
-
-                self.possible_moves.append([x - 1, y])
-                if x >= 2:
-
-                    if board[x - 2][y].piece and board[x - 2][y].piece_color != self.piece_color:
-                        self.possible_kills.append([x - 2, y])
-
-                x -= 1
-
-            # kill check if close
-            if x >= 1:
-                if board[x - 1][y].piece and board[x - 1][y].piece_color != self.piece_color:
-                    self.possible_kills.append([x - 1, y])
-
-    def queen_exec(self, board):
-        self.possible_moves = []
-        self.possible_kills = []
-
-        x = self.x
-        y = self.y
-
-        # left up
-        if not (x <= 0 or y <= 0):
-            while not board[x - 1][y - 1].piece and x != 0 and y != 0:
-                self.possible_moves.append([x - 1, y - 1])
-                if x >= 2 and y >= 2:
-                    if board[x - 2][y - 2].piece and board[x - 2][y - 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x - 2, y - 2])
-                x -= 1
-                y -= 1
-
-            # kill check if close
-            if x >= 1 and y >= 1:
-                if board[x - 1][y - 1].piece and board[x - 1][y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x - 1, y - 1])
-
-        x = self.x
-        y = self.y
-
-        # right up
-        if not (x >= 7 or y <= 0):
-            while not board[x + 1][y - 1].piece and x != 7 and y != 0:
-                self.possible_moves.append([x + 1, y - 1])
-                if x <= 5 and y >= 2:
-                    if board[x + 2][y - 2].piece and board[x + 2][y - 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x + 2, y - 2])
-
-                if x >= 6:
-                    break
-                x += 1
-                y -= 1
-
-            # kill check if close
-            if x <= 6 and y >= 1:
-                if board[x + 1][y - 1].piece and board[x + 1][y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x + 1, y - 1])
-
-        x = self.x
-        y = self.y
-
-        # right down
-        if not (x >= 7 or y >= 7):
-            while not board[x + 1][y + 1].piece and x != 7 and y != 7:
-                self.possible_moves.append([x + 1, y + 1])
-                if x <= 5 and y <= 5:
-                    if board[x + 2][y + 2].piece and board[x + 2][y + 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x + 2, y + 2])
-
-                if x >= 6 or y >= 6:
-                    break
-                x += 1
-                y += 1
-
-            # kill check if close
-            if x <= 6 and y <= 6:
-                if board[x + 1][y + 1].piece and board[x + 1][y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x + 1, y + 1])
-
-        x = self.x
-        y = self.y
-
-        # left down
-        if not (x <= 0 or y >= 7):
-
-            while not board[x - 1][y + 1].piece and x != 0 and y != 7:
-
-                self.possible_moves.append([x - 1, y + 1])
-                if x >= 2 and y <= 5:
-
-                    if board[x - 2][y + 2].piece and board[x - 2][y + 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x - 2, y + 2])
-
-                if y >= 6:
-                    break
-                x -= 1
-                y += 1
-
-            # kill check if close
-            if x >= 1 and y <= 6:
-                if board[x - 1][y + 1].piece and board[x - 1][y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x - 1, y + 1])
-
-        x = self.x
-        y = self.y
-
-        # up
-        if y > 0:
-            while not board[x][y - 1].piece and y != 0:
-                self.possible_moves.append([x, y - 1])
-                if y >= 2:
-                    if board[x][y - 2].piece and board[x][y - 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x, y - 2])
-
-                y -= 1
-
-            # kill check if close
-            if y >= 1:
-                if board[x][y - 1].piece and board[x][y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x, y - 1])
-
-        x = self.x
-        y = self.y
-
-        # right
-        if x < 7:
-
-            while not board[x + 1][y].piece and x != 7:
-
-                self.possible_moves.append([x + 1, y])
-                if x <= 5:
-                    if board[x + 2][y].piece and board[x + 2][y].piece_color != self.piece_color:
-                        self.possible_kills.append([x + 2, y])
-
-                if x >= 6:
-                    break
-                x += 1
-
-            # kill check if close
-            if x <= 6:
-                if board[x + 1][y].piece and board[x + 1][y].piece_color != self.piece_color:
-                    self.possible_kills.append([x + 1, y])
-
-        x = self.x
-        y = self.y
-
-        # down
-        if y < 7:
-            while not board[x][y + 1].piece and y != 7:
-                self.possible_moves.append([x, y + 1])
-                if y <= 5:
-                    if board[x][y + 2].piece and board[x][y + 2].piece_color != self.piece_color:
-                        self.possible_kills.append([x, y + 2])
-
-                if y >= 6:
-                    break
-                y += 1
-
-            # kill check if close
-            if y <= 6:
-                if board[x][y + 1].piece and board[x][y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([x, y + 1])
-
-        x = self.x
-        y = self.y
-
-        # left
-
-        if x > 0:
-
-            while not board[x - 1][y].piece and x != 0:
-
-                self.possible_moves.append([x - 1, y])
-                if x >= 2:
-
-                    if board[x - 2][y].piece and board[x - 2][y].piece_color != self.piece_color:
-                        self.possible_kills.append([x - 2, y])
-
-                x -= 1
-
-            # kill check if close
-            if x >= 1:
-                if board[x - 1][y].piece and board[x - 1][y].piece_color != self.piece_color:
-                    self.possible_kills.append([x - 1, y])
-
-    def king_exec(self, board):
-        self.possible_moves = []
-        self.possible_kills = []
-
-        # left
-        if self.x > 0:
-            if board[self.x - 1][self.y].piece:
-                if board[self.x - 1][self.y].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 1, self.y])
-            else:
-                self.possible_moves.append([self.x - 1, self.y])
-
-        # up
-        if self.y > 0:
-            if board[self.x][self.y - 1].piece:
-                if board[self.x][self.y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x, self.y - 1])
-            else:
-                self.possible_moves.append([self.x, self.y - 1])
-
-        # right
-        if self.x < 7:
-            if board[self.x + 1][self.y].piece:
-                if board[self.x + 1][self.y].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 1, self.y])
-            else:
-                self.possible_moves.append([self.x + 1, self.y])
-
-        # down
-        if self.y < 7:
-            if board[self.x][self.y + 1].piece:
-                if board[self.x][self.y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x, self.y + 1])
-            else:
-                self.possible_moves.append([self.x, self.y + 1])
-
-        # left up
-        if self.x > 0 and self.y > 0:
-            if board[self.x - 1][self.y - 1].piece:
-                if board[self.x - 1][self.y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 1, self.y - 1])
-            else:
-                self.possible_moves.append([self.x - 1, self.y - 1])
-
-        # right up
-        if self.x < 7 and self.y > 0:
-            if board[self.x + 1][self.y - 1].piece:
-                if board[self.x + 1][self.y - 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 1, self.y - 1])
-            else:
-                self.possible_moves.append([self.x + 1, self.y - 1])
-
-        # right down
-        if self.x < 7 and self.y < 7:
-            if board[self.x + 1][self.y + 1].piece:
-                if board[self.x + 1][self.y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x + 1, self.y + 1])
-            else:
-                self.possible_moves.append([self.x + 1, self.y + 1])
-
-        # left down
-        if self.x > 0 and self.y < 7:
-            if board[self.x - 1][self.y + 1].piece:
-                if board[self.x - 1][self.y + 1].piece_color != self.piece_color:
-                    self.possible_kills.append([self.x - 1, self.y + 1])
-            else:
-                self.possible_moves.append([self.x - 1, self.y + 1])
-
-
-    def move(self, x, y):
-        if [x, y] in self.possible_moves or [x, y] in self.possible_kills or [x, y] in self.possible_castle:
-            # if king or rook moves, forbid castling
-            if self.piece == "k":
-                game.forbid_castling(2, self.piece_color)
-
-            if self.piece == "r":
-                if self.x == 0:
-                    game.forbid_castling(0, self.piece_color)
-
-                if self.x == 7:
-                    game.forbid_castling(1, self.piece_color)
-
-            board[x][y].piece = self.piece
-            board[x][y].piece_color = self.piece_color
-            self.piece = ""
-
-
-        # this moves rooks in castle
-        if [x, y] in self.possible_castle:
-            if [x, y] == [2, 7]:
-                board[0][7].piece = ""
-                board[3][7].piece = "r"
-                board[3][7].piece_color = 1
-
-            if [x, y] == [6, 7]:
-                board[7][7].piece = ""
-                board[5][7].piece = "r"
-                board[5][7].piece_color = 1
-
-            if [x, y] == [6, 0]:
-                board[7][0].piece = ""
-                board[5][0].piece = "r"
-                board[5][0].piece_color = 0
-
-            if [x, y] == [2, 0]:
-                board[0][0].piece = ""
-                board[3][0].piece = "r"
-                board[3][0].piece_color = 0
-
-    def check_castling(self):
-        castle_results = [False, False]  # [white_long, white_short]
-
-        self.castle = game.get_castle_options(color=self.piece_color)
-
-        # white
-        if self.piece == "k":
-            if self.piece_color and not is_check(board, 1):
-                if self.castle[0]:  # long castle
-                    if self.x == 4 and self.y == 7 and board[0][7].piece == "r" and \
-                            not board[1][7].piece and not is_threatened(board, not self.piece_color, [1, 7]) and \
-                            not board[2][7].piece and not is_threatened(board, not self.piece_color, [2, 7]) and \
-                            not board[3][7].piece and not is_threatened(board, not self.piece_color, [3, 7]):
-                        castle_results[0] = True
-
-                if self.castle[1]:  # short castle
-                    if self.x == 4 and self.y == 7 and board[7][7].piece == "r" and \
-                            not board[5][7].piece and not is_threatened(board, not self.piece_color, [5, 7]) and \
-                            not board[6][7].piece and not is_threatened(board, not self.piece_color, [6, 7]):
-                        castle_results[1] = True
-
-            # black
-            if self.piece_color == 0:
-
-                if self.castle[0] and not is_check(board, 0):  # long castle
-                    if self.x == 4 and self.y == 0 and board[0][0].piece == "r" and \
-                            not board[1][0].piece and not is_threatened(board, not self.piece_color, [1, 0]) and \
-                            not board[2][0].piece and not is_threatened(board, not self.piece_color, [2, 0]) and \
-                            not board[3][0].piece and not is_threatened(board, not self.piece_color, [3, 0]):
-                        castle_results[0] = True
-
-                if self.castle[1] and not is_check(board, 0):  # short castle
-                    if self.x == 4 and self.y == 0 and board[7][0].piece == "r" and \
-                            not board[5][0].piece and not is_threatened(board, not self.piece_color, [5, 0]) and \
-                            not board[6][0].piece and not is_threatened(board, not self.piece_color, [6, 0]):
-                        castle_results[1] = True
-
-        return castle_results
-
-    def castle_to_coords(self, castle):
-        coords = []
-        if self.piece_color:
-            if castle[0]:
-                coords.append([2, 7])
-            if castle[1]:
-                coords.append([6, 7])
-
-        else:
-            if castle[0]:
-                coords.append([2, 0])
-            if castle[1]:
-                coords.append([6, 0])
-
-        return coords
-
-    def check_pawn_promotion(self):
-        print(self.piece, self.x, self.y)
-        if self.piece == "p":
-            if self.piece_color and self.y == 0:
-                return True
-
-            if not self.piece_color and self.y == 7:
-                return True
-
-        return False
-
     def get_possible_moves(self):
         return self.possible_moves
 
@@ -904,6 +205,44 @@ def init_cells():
         board.append(temp_array)
         flag = not flag
 
+def get_cell(pos):  # cell under a point of the window, None outside the board or on a border
+    x, y = pos[0] // (CELL_WIDTH + BORDER), pos[1] // (CELL_HEIGHT + BORDER)
+    if 0 <= x < COLS and 0 <= y < ROWS and \
+            pos[0] % (CELL_WIDTH + BORDER) < CELL_WIDTH and pos[1] % (CELL_HEIGHT + BORDER) < CELL_HEIGHT:
+        return board[x][y]
+
+def render_board():  # the squares never change, so they are drawn once
+    surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+    surface.fill(pygame.Color("white"))
+    for i in board:
+        for j in i:
+            surface.fill(BLACK_CELL_COLOR if j.color == 0 else WHITE_CELL_COLOR, j.get_rect())
+    return surface
+
+def render_highlights():  # tag colors over a transparent board, drawn again only when the selection changes
+    surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA).convert_alpha()
+    surface.fill((0, 0, 0, 0))
+    for i in board:
+        for j in i:
+            if j.tag_color != (0, 0, 0):
+                surface.fill(j.tag_color, j.get_rect())
+    return surface
+
+def redraw_all():
+    for i in board:
+        for j in i:
+            j.dirty = True
+
+def draw_cells():  # draws the cells that changed, returns their rectangles
+    dirty_rects = []
+    for i in board:
+        for j in i:
+            if j.dirty:
+                j.draw()
+                j.dirty = False
+                dirty_rects.append(j.get_rect())
+    return dirty_rects
+
 def untag_all():
     for i in board:
         for j in i:
@@ -913,126 +252,218 @@ def get_chosen():
     if isChosen:
         return board[chosen[0]][chosen[1]]
 
-def fill_board():
-    global board
-    # black
-    board[0][0].set_piece("r", 0)
-    board[1][0].set_piece("n", 0)
-    board[2][0].set_piece("b", 0)
-    board[3][0].set_piece("q", 0)
-    board[4][0].set_piece("k", 0)
-    board[5][0].set_piece("b", 0)
-    board[6][0].set_piece("n", 0)
-    board[7][0].set_piece("r", 0)
-    board[0][1].set_piece("p", 0)
-    board[1][1].set_piece("p", 0)
-    board[2][1].set_piece("p", 0)
-    board[3][1].set_piece("p", 0)
-    board[4][1].set_piece("p", 0)
-    board[5][1].set_piece("p", 0)
-    board[6][1].set_piece("p", 0)
-    board[7][1].set_piece("p", 0)
-    # white
-    board[0][7].set_piece("r", 1)
-    board[1][7].set_piece("n", 1)
-    board[2][7].set_piece("b", 1)
-    board[3][7].set_piece("q", 1)
-    board[4][7].set_piece("k", 1)
-    board[5][7].set_piece("b", 1)
-    board[6][7].set_piece("n", 1)
-    board[7][7].set_piece("r", 1)
-    board[0][6].set_piece("p", 1)
-    board[1][6].set_piece("p", 1)
-    board[2][6].set_piece("p", 1)
-    board[3][6].set_piece("p", 1)
-    board[4][6].set_piece("p", 1)
-    board[5][6].set_piece("p", 1)
-    board[6][6].set_piece("p", 1)
-    board[7][6].set_piece("p", 1)
-
-game = Game()
-promotion_menu = Promotion_menu(0)
-
-board = []
-
-isChosen = False
-chosen = [0, 0]
-
-promotion_coords = []
-
-#game.disable()
-init_cells()
-fill_board()
-
-run = True
-while run:
-    clock.tick(FPS)
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            run = False
+def choose(cell):
+    global isChosen, chosen
+    untag_all()
+    isChosen = True
+    chosen = [cell.x, cell.y]
+    cell.set_tag_color(SELECTED_CELL_COLOR)
+
+    # moves only change when a move is made, so they are calculated once per selection
+    cell.calc_moves(game)
+    for square in cell.possible_moves | cell.possible_castle:
+        x, y = to_coords(square)
+        board[x][y].set_tag_color((0, 0, 120))
+    for square in cell.possible_kills:
+        x, y = to_coords(square)
+        board[x][y].set_tag_color((120, 0, 0))
+
+def click_cell(cell):
+    global isChosen, promotion_move
+    if not isChosen:
+        untag_all()
+        if cell.piece and cell.piece_color == game.get_turn():
+            choose(cell)
+        else:
+            untag_all()
+            isChosen = False
+
+    else:
+        start = to_square(chosen[0], chosen[1])
+        end = to_square(cell.x, cell.y)
+        if end in get_chosen().possible_moves or end in get_chosen().possible_kills or \
+                end in get_chosen().possible_castle:
+            if game.is_promotion(start, end):
+                game.disable()
+                promotion_menu.buttons_init(get_chosen().piece_color)
+                promotion_menu.set_visible(True)
+                promotion_move = [start, end]
+            else:
+                play_move(game.find_move(start, end))
 
-    if isChosen:
-        get_chosen().calc_moves(board)
-        for i in get_chosen().possible_moves + get_chosen().possible_castle:
-            board[i[0]][i[1]].set_tag_color((0, 0, 120))
-        for i in get_chosen().possible_kills:
-            board[i[0]][i[1]].set_tag_color((120, 0, 0))
+            isChosen = False
+            untag_all()
+        else:
+            if cell.piece and cell.piece_color == game.get_turn():
+                choose(cell)
+            else:
+                untag_all()
+                isChosen = False
 
+def sync_board():
     for i in board:
         for j in i:
+            j.set_piece(*game.get_piece(to_square(j.x, j.y)))
+
+def play_move(move):
+    game.play(move)
+    sync_board()
+    show_status()
+
+def go_to_ply(ply):
+    global isChosen
+    game.go_to_ply(ply)
+    if promotion_menu.visible:
+        promotion_menu.set_visible(False)
+        game.enable()
+    isChosen = False
+    untag_all()
+    sync_board()
+    show_status()
+
+def show_status():
+    # calculate checkmate, the search for a legal move stops at the first one found
+    in_check = game.is_check(int(game.get_turn()))
+    has_moves = game.has_legal_move()
+    if in_check and not has_moves:
+        pygame.display.set_caption("Checkmate")
+        print("CheckMate")
+    elif not has_moves:
+        pygame.display.set_caption("Stalemate")
+        print("Stalemate")
+    elif in_check:
+        print("Check")
+        pygame.display.set_caption("Check")
+    else:
+        pygame.display.set_caption("Chess")
+
+if __name__ == "__main__":
+    pygame.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT))
+    clock = pygame.time.Clock()
+    pygame.display.set_caption("Chess")
+
+    game = Game()
+    promotion_menu = Promotion_menu(0)
+    promotion_menu.set_visible(False)
+
+    board = []
+
+    isChosen = False
+    chosen = [0, 0]
+
+    promotion_move = []
+
+    pressed_cell = None  # cell the left button went down on
+
+    computer_color = COMPUTER_COLOR
+    search_worker = None  # started the first time the computer has to move
+    job = None  # number of the search the computer is waiting for
+
+    #game.disable()
+    init_cells()
+    if len(sys.argv) > 1:  # python chess.py "<fen>" starts from that position
+        try:
+            load_fen(game, sys.argv[1])
+        except ValueError as error:
+            sys.exit(str(error))
+    else:
+        game.fill_board()
+    sync_board()
+
+    board_surface = render_board()
+    highlight_overlay = render_highlights()
+    highlights_changed = False
 
-            j.draw()
-            promotion_menu.draw()
-
-            if j.on_click() and game.enabled:
-                if not isChosen:
-                    untag_all()
-                    # if j.piece and j.piece_color == game.get_turn():
-                    if j.piece:
-                        isChosen = True
-                        chosen = [j.x, j.y]
-                        get_chosen().set_tag_color(SELECTED_CELL_COLOR)
-                    else:
-                        untag_all()
-                        isChosen = False
-
-                else:
-                    if [j.x, j.y] in get_chosen().possible_moves or [j.x, j.y] in get_chosen().possible_kills or \
-                                                                    [j.x,j.y] in get_chosen().possible_castle:
-                        get_chosen().move(j.x, j.y)
-                        if board[j.x][j.y].check_pawn_promotion():
-                            game.disable()
-                            promotion_menu.buttons_init(board[j.x][j.y].piece_color)
-                            promotion_menu.visible = True
-                            promotion_coords = [j.x, j.y]
-
-                        game.switch_turn()
-                        # calculate checkmate
-
-                        if calc_checkmate(board, not get_chosen().piece_color):
-                            pygame.display.set_caption("Checkmate")
-                            print("CheckMate")
-                        elif is_check(board, not get_chosen().piece_color):
-                            print("Check")
-                            pygame.display.set_caption("Check")
-                        else:
-                            pygame.display.set_caption("Chess")
-
-
-
-                        isChosen = False
-                        untag_all()
-                    else:
-                        # if j.piece and j.piece_color == game.get_turn():
-                        if j.piece:
-                            untag_all()
-                            isChosen = True
-                            chosen = [j.x, j.y]
-                            get_chosen().set_tag_color(SELECTED_CELL_COLOR)
-                        else:
-                            untag_all()
-                            isChosen = False
-    pygame.display.flip()
     win.fill(pygame.Color("white"))
+    run = True
+    while run:
+        clock.tick(FPS)
+
+        # input: every event and click of the frame is collected before anything changes
+        clicked = []  # a click is a press and a release on the same cell
+        target_ply = None  # ply to show, set by the history keys
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                run = False
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                pressed_cell = get_cell(event.pos)
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                if pressed_cell is not None and get_cell(event.pos) is pressed_cell:
+                    clicked.append(pressed_cell)
+                pressed_cell = None
+            promotion_menu.event_handler(event)
+            if event.type == pygame.VIDEOEXPOSE:  # the window was covered, everything has to be shown again
+                redraw_all()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_f:
+                    print(get_fen(game))
+                elif event.key == pygame.K_SPACE and job is not None:  # move now
+                    search_worker.move_now(job)
+                elif event.key == pygame.K_ESCAPE and job is not None:  # stop, the side is played by hand from now on
+                    search_worker.cancel(job)
+                    job = None
+                    computer_color = None
+                    pygame.display.set_caption("Chess")
+                elif event.key == pygame.K_c and job is None:  # computer takes the side to move
+                    computer_color = game.get_turn()
+                # presses of one frame add up, each step counts from the ply the previous one asked for
+                elif event.key == pygame.K_LEFT:  # move back
+                    target_ply = max(0, (game.get_ply() if target_ply is None else target_ply) - 1)
+                elif event.key == pygame.K_RIGHT:  # move forward
+                    target_ply = min(game.get_last_ply(), (game.get_ply() if target_ply is None else target_ply) + 1)
+                elif event.key == pygame.K_HOME:
+                    target_ply = 0
+                elif event.key == pygame.K_END:
+                    target_ply = game.get_last_ply()
+
+        promotion_choice = promotion_menu.get_choice() if promotion_menu.visible else None
+
+        # update
+        if target_ply is not None:  # the computer stops, it can be given a side again with C
+            if job is not None:
+                search_worker.cancel(job)
+                job = None
+            computer_color = None
+            go_to_ply(target_ply)
+        elif promotion_choice is not None:
+            promotion_menu.set_visible(False)
+            game.enable()
+            play_move(game.find_move(promotion_move[0], promotion_move[1], promotion_choice))
+        else:
+            for cell in clicked:
+                if game.enabled and job is None:
+                    click_cell(cell)
+
+        if job is None and game.enabled and game.get_turn() == computer_color and game.legal_moves():
+            if search_worker is None:
+                search_worker = SearchWorker(TABLE_SIZE)
+            job = search_worker.start(game, COMPUTER_TIME)
+            pygame.display.set_caption("Chess - thinking")
+
+        if job is not None:
+            result = search_worker.poll(job)
+            if result is not None:
+                job = None
+                if result[0] is not None:
+                    play_move(result[0])
+                else:  # nothing to play, the board is left to the player
+                    computer_color = None
+                    pygame.display.set_caption("Chess")
+
+        # draw: the cells with their highlights, then the menu over them, only what changed reaches the screen
+        if promotion_menu.dirty:
+            promotion_menu.dirty = False
+            redraw_all()  # shown - it is drawn over the cells, hidden - the cells under it come back
+        if highlights_changed:
+            highlight_overlay = render_highlights()
+            highlights_changed = False
+        dirty_rects = draw_cells()
+        if promotion_menu.visible and dirty_rects:
+            promotion_menu.draw()
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
 
-pygame.quit()
+    if search_worker is not None:
+        search_worker.close()
+    pygame.quit()
@@ -14,4 +14,8 @@ SELECTED_CELL_COLOR = (77, 148, 79)
 POSSIBLE_MOVE_COLOR_WHITE = (92, 152, 247)
 POSSIBLE_MOVE_COLOR_BLACK = (48, 84, 140)
 POSSIBLE_KILL_COLOR_WHITE = (247, 92, 92)  # not used
-POSSIBLE_KILL_COLOR_BLACK = (156, 40, 40)
\ No newline at end of file
+POSSIBLE_KILL_COLOR_BLACK = (156, 40, 40)
+
+COMPUTER_COLOR = None  # side played by the computer: 0 - black, 1 - white, None - two players
+COMPUTER_TIME = 1.0  # seconds the computer thinks about a move
+TABLE_SIZE = 16  # megabytes of the computer's transposition table
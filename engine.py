@@ -0,0 +1,501 @@
+from utilities import *
+from zobrist import *
+
+# Headless rules engine. Squares are numbered 0..63 row by row (see utilities.to_square),
+# row 0 is the black back rank, so white pawns move towards y = 0.
+# A move is an int: start | end << 6 | promotion << 12 | flags, see encode_move.
+
+KNIGHT_STEPS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+KING_STEPS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+PROMOTION_PIECES = ("q", "n", "r", "b")
+PROMOTION_CODES = {"": 0, "q": 1, "n": 2, "r": 3, "b": 4}
+PROMOTION_LETTERS = ["", "q", "n", "r", "b"]
+
+# move flags, already shifted into place
+CAPTURE = 1 << 15  # also set for en passant
+EN_PASSANT = 1 << 16
+CASTLE = 1 << 17
+DOUBLE_PUSH = 1 << 18
+
+
+def calc_step_targets(steps):
+    table = []
+    for square in range(ROWS * COLS):
+        x, y = to_coords(square)
+        table.append([to_square(x + dx, y + dy) for dx, dy in steps
+                      if 0 <= x + dx < COLS and 0 <= y + dy < ROWS])
+    return table
+
+
+def calc_rays(directions):
+    table = []
+    for square in range(ROWS * COLS):
+        x, y = to_coords(square)
+        rays = []
+        for dx, dy in directions:
+            ray = []
+            i, j = x + dx, y + dy
+            while 0 <= i < COLS and 0 <= j < ROWS:
+                ray.append(to_square(i, j))
+                i += dx
+                j += dy
+            rays.append(ray)
+        table.append(rays)
+    return table
+
+
+KNIGHT_TARGETS = calc_step_targets(KNIGHT_STEPS)
+KING_TARGETS = calc_step_targets(KING_STEPS)
+PAWN_ATTACKS = [calc_step_targets(((-1, 1), (1, 1))),  # black pawns take downwards
+                calc_step_targets(((-1, -1), (1, -1)))]  # white pawns take upwards
+
+BISHOP_RAYS = calc_rays(BISHOP_DIRECTIONS)
+ROOK_RAYS = calc_rays(ROOK_DIRECTIONS)
+SLIDER_RAYS = {"b": BISHOP_RAYS,
+               "r": ROOK_RAYS,
+               "q": [BISHOP_RAYS[i] + ROOK_RAYS[i] for i in range(ROWS * COLS)],
+               }
+
+# BETWEEN[a][b] - squares strictly between a and b when they share a line, a check on that line is blocked there
+BETWEEN = [[[] for end in range(ROWS * COLS)] for start in range(ROWS * COLS)]
+for start in range(ROWS * COLS):
+    for ray in SLIDER_RAYS["q"][start]:
+        for i in range(len(ray)):
+            BETWEEN[start][ray[i]] = ray[:i]
+
+# king start square, king target, rook start, rook target, squares that must be empty, squares that must be safe
+CASTLING = {1: [(60, 58, 56, 59, (57, 58, 59), (58, 59)),  # long castle
+                (60, 62, 63, 61, (61, 62), (61, 62))],  # short castle
+            0: [(4, 2, 0, 3, (1, 2, 3), (2, 3)),
+                (4, 6, 7, 5, (5, 6), (5, 6))],
+            }
+
+# king target of a castle: rook start, rook target
+CASTLING_ROOKS = {king_end: (rook_start, rook_end)
+                  for color in CASTLING
+                  for king_start, king_end, rook_start, rook_end, empty, safe in CASTLING[color]}
+
+# castling right lost when something leaves or arrives on this square: [color, castle index]
+CASTLING_SQUARES = {56: [1, 0], 63: [1, 1], 0: [0, 0], 7: [0, 1]}
+
+
+class Position():
+    def __init__(self):
+        self.pieces = [""] * (ROWS * COLS)  # b - bishop, n - knight, p - pawn, k - king, q - queen, r - rook
+        self.colors = [0] * (ROWS * COLS)  # 1 - white, 0 - black
+        self.white_castle = [1, 1]  # left digit - long castle, right digit - short castle
+        self.black_castle = [1, 1]  # left digit - long castle, right digit - short castle
+        self.turn = True  # True - white, False - black
+        self.en_passant = None  # square behind a pawn that has just moved two squares
+        self.halfmove_clock = 0  # moves since the last capture or pawn move
+        self.fullmove_number = 1  # grows after every black move
+        self.history = []  # undo records of the moves made
+        self.attack_maps = [None, None]  # squares attacked by black and white, bit n - square n
+        self.kings = [None, None]  # squares of the black and white king
+        self.hash = TURN_KEY ^ CASTLE_KEYS[self.get_castle_rights()]  # Zobrist hash, kept up to date by every move
+        self.cached_key = None  # key of the position the cached legal moves belong to
+        self.cached_moves = []
+
+    def fill_board(self):
+        back_rank = ["r", "n", "b", "q", "k", "b", "n", "r"]
+        for x in range(COLS):
+            self.set_piece(to_square(x, 0), back_rank[x], 0)
+            self.set_piece(to_square(x, 1), "p", 0)
+            self.set_piece(to_square(x, 6), "p", 1)
+            self.set_piece(to_square(x, 7), back_rank[x], 1)
+
+    def copy(self):
+        position = self.__class__()
+        for square in range(ROWS * COLS):
+            if self.pieces[square]:
+                position.set_piece(square, self.pieces[square], self.colors[square])
+        position.white_castle = self.white_castle[:]
+        position.black_castle = self.black_castle[:]
+        position.turn = self.turn
+        position.en_passant = self.en_passant
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.hash = self.hash
+        position.history = self.history[:]  # undo records are tuples, so they can be shared
+        return position
+
+    def set_piece(self, square, piece, color):
+        if self.pieces[square]:
+            self.hash ^= PIECE_KEYS[self.colors[square]][self.pieces[square]][square]
+            if self.pieces[square] == "k" and self.kings[self.colors[square]] == square:
+                self.kings[self.colors[square]] = None
+        if piece:
+            self.hash ^= PIECE_KEYS[color][piece][square]
+            if piece == "k":
+                self.kings[color] = square
+        self.pieces[square] = piece
+        self.colors[square] = color
+        self.attack_maps[0] = self.attack_maps[1] = None
+
+    def get_piece(self, square):
+        return self.pieces[square], self.colors[square]
+
+    def switch_turn(self):
+        self.turn = not self.turn
+        self.hash ^= TURN_KEY
+
+    def get_turn(self):
+        return self.turn
+
+    def get_castle_options(self, color):
+        return self.white_castle if color else self.black_castle
+
+    def forbid_castling(self, value, color):  # value: 0 - long castle, 1 - short castle, 2 - both
+        castle = self.get_castle_options(color)
+        if value == 2:
+            castle[0] = castle[1] = 0
+        else:
+            castle[value] = 0
+
+    def get_castle_rights(self):  # all four castle digits packed into one number for undo records
+        return self.white_castle[0] | self.white_castle[1] << 1 | self.black_castle[0] << 2 | self.black_castle[1] << 3
+
+    def set_castle_rights(self, rights):
+        self.white_castle[0] = rights & 1
+        self.white_castle[1] = rights >> 1 & 1
+        self.black_castle[0] = rights >> 2 & 1
+        self.black_castle[1] = rights >> 3 & 1
+
+    def get_king_pos(self, color):
+        return self.kings[color]
+
+    def get_attacks(self, square):
+        piece = self.pieces[square]
+        if piece == "p":
+            return PAWN_ATTACKS[self.colors[square]][square]
+        if piece == "n":
+            return KNIGHT_TARGETS[square]
+        if piece == "k":
+            return KING_TARGETS[square]
+
+        attacks = []
+        for ray in SLIDER_RAYS[piece][square]:
+            for target in ray:
+                attacks.append(target)
+                if self.pieces[target]:
+                    break
+        return attacks
+
+    def get_attack_map(self, color):
+        if self.attack_maps[color] is None:
+            attack_map = 0
+            for start in range(ROWS * COLS):
+                if self.pieces[start] and self.colors[start] == color:
+                    for square in self.get_attacks(start):
+                        attack_map |= 1 << square
+            self.attack_maps[color] = attack_map
+        return self.attack_maps[color]
+
+    def is_threatened(self, color, square):  # color - side that attacks the square
+        return bool(self.get_attack_map(color) >> square & 1)
+
+    def is_attacked(self, color, square, hidden=None):  # same answer without a map, looks from the square outwards
+        # hidden - square that sliders see through, the king when it looks for a square to step to
+        for start in PAWN_ATTACKS[1 - color][square]:
+            if self.pieces[start] == "p" and self.colors[start] == color:
+                return True
+        for start in KNIGHT_TARGETS[square]:
+            if self.pieces[start] == "n" and self.colors[start] == color:
+                return True
+        for start in KING_TARGETS[square]:
+            if self.pieces[start] == "k" and self.colors[start] == color:
+                return True
+
+        for rays, sliders in ((BISHOP_RAYS, "bq"), (ROOK_RAYS, "rq")):
+            for ray in rays[square]:
+                for start in ray:
+                    if self.pieces[start] and start != hidden:
+                        if self.colors[start] == color and self.pieces[start] in sliders:
+                            return True
+                        break
+        return False
+
+    def is_check(self, color):
+        return self.is_threatened(1 - color, self.get_king_pos(color))
+
+    def get_checks_and_pins(self, color):  # checking squares and {pinned square: squares it can still move to}
+        king = self.get_king_pos(color)
+        enemy = 1 - color
+        checkers = []
+        for start in PAWN_ATTACKS[color][king]:
+            if self.pieces[start] == "p" and self.colors[start] == enemy:
+                checkers.append(start)
+        for start in KNIGHT_TARGETS[king]:
+            if self.pieces[start] == "n" and self.colors[start] == enemy:
+                checkers.append(start)
+
+        pins = {}
+        for rays, sliders in ((BISHOP_RAYS, "bq"), (ROOK_RAYS, "rq")):
+            for ray in rays[king]:
+                blocker = None  # first own piece on the ray, pinned if an enemy slider stands behind it
+                for i in range(len(ray)):
+                    square = ray[i]
+                    if self.pieces[square]:
+                        if self.colors[square] == color:
+                            if blocker is not None:
+                                break
+                            blocker = square
+                        else:
+                            if self.pieces[square] in sliders:
+                                if blocker is None:
+                                    checkers.append(square)
+                                else:
+                                    pins[blocker] = ray[:i + 1]  # along the ray up to the pinning piece
+                            break
+        return checkers, pins
+
+    def pseudo_legal_moves(self):
+        color = int(self.turn)
+        moves = []
+        for start in range(ROWS * COLS):
+            if self.pieces[start] and self.colors[start] == color:
+                self.add_piece_moves(start, color, moves)
+
+        self.add_castling_moves(color, moves)
+        return moves
+
+    def add_piece_moves(self, start, color, moves):
+        if self.pieces[start] == "p":
+            self.add_pawn_moves(start, color, moves)
+        else:
+            for end in self.get_attacks(start):
+                if not self.pieces[end]:
+                    moves.append(start | end << 6)
+                elif self.colors[end] != color:
+                    moves.append(start | end << 6 | CAPTURE)
+
+    def get_king_escapes(self, color):  # squares the king can step to without being attacked
+        king = self.get_king_pos(color)
+        # sliders see through the king, so it does not hide the squares behind it from a checking line
+        return [end for end in KING_TARGETS[king]
+                if (not self.pieces[end] or self.colors[end] != color) and not self.is_attacked(1 - color, end, king)]
+
+    def filter_legal(self, moves, checks):  # legal part of pseudo-legal moves, checks from get_checks_and_pins
+        checkers, pins = checks
+        color = int(self.turn)
+        king = self.get_king_pos(color)
+        targets = BETWEEN[king][checkers[0]] + [checkers[0]] if len(checkers) == 1 else None  # take or block
+        escapes = None
+        legal = []
+        for move in moves:
+            start, end = move & 63, move >> 6 & 63
+            if start == king:
+                if move & CASTLE:  # castling was checked when it was generated
+                    legal.append(move)
+                else:
+                    if escapes is None:
+                        escapes = self.get_king_escapes(color)
+                    if end in escapes:
+                        legal.append(move)
+            elif len(checkers) > 1:  # double check, only the king can move
+                continue
+            elif move & EN_PASSANT:
+                # both pawns leave the row at once, which no pin line covers, so it is tried on the board
+                if self.is_legal(move):
+                    legal.append(move)
+            elif (targets is None or end in targets) and (start not in pins or end in pins[start]):
+                legal.append(move)
+        return legal
+
+    def add_pawn_moves(self, start, color, moves):
+        forward = -COLS if color else COLS
+        end = start + forward
+        if not self.pieces[end]:
+            self.add_pawn_move(start | end << 6, moves)
+            if start // COLS == (6 if color else 1) and not self.pieces[end + forward]:
+                moves.append(start | (end + forward) << 6 | DOUBLE_PUSH)
+
+        for end in PAWN_ATTACKS[color][start]:
+            if self.pieces[end] and self.colors[end] != color:
+                self.add_pawn_move(start | end << 6 | CAPTURE, moves)
+            elif end == self.en_passant:
+                moves.append(start | end << 6 | CAPTURE | EN_PASSANT)
+
+    def add_pawn_move(self, move, moves):
+        if (move >> 6 & 63) // COLS in (0, ROWS - 1):
+            for piece in PROMOTION_PIECES:
+                moves.append(move | PROMOTION_CODES[piece] << 12)
+        else:
+            moves.append(move)
+
+    def add_castling_moves(self, color, moves):
+        castle = self.get_castle_options(color)
+        if not castle[0] and not castle[1]:
+            return
+
+        attack_map = self.get_attack_map(1 - color)
+        if attack_map >> self.get_king_pos(color) & 1:  # no castling out of check
+            return
+
+        for i in range(2):
+            king_start, king_end, rook_start, rook_end, empty, safe = CASTLING[color][i]
+            if castle[i] and self.pieces[rook_start] == "r" and self.colors[rook_start] == color and \
+                    not any(self.pieces[square] for square in empty) and \
+                    not any(attack_map >> square & 1 for square in safe):
+                moves.append(king_start | king_end << 6 | CASTLE)
+
+    def calc_hash(self):  # from scratch, after turn, castle rights or en passant were set directly
+        self.hash = CASTLE_KEYS[self.get_castle_rights()]
+        if self.turn:
+            self.hash ^= TURN_KEY
+        if self.en_passant is not None:
+            self.hash ^= EN_PASSANT_KEYS[self.en_passant % COLS]
+        for square in range(ROWS * COLS):
+            if self.pieces[square]:
+                self.hash ^= PIECE_KEYS[self.colors[square]][self.pieces[square]][square]
+        return self.hash
+
+    def get_key(self):
+        return self.hash
+
+    def is_legal(self, move):  # move has to be pseudo-legal, tried on the board
+        color = int(self.turn)
+        self.make_move(move)
+        # the position changes with every candidate, so a full attack map would not be reused
+        legal = not self.is_attacked(1 - color, self.get_king_pos(color))
+        self.unmake_move()
+        return legal
+
+    def legal_moves(self):  # the returned list is shared with the cache, do not modify it
+        key = self.get_key()
+        if key == self.cached_key:
+            return self.cached_moves
+
+        moves = self.generate_legal_moves()
+
+        self.cached_key = key
+        self.cached_moves = moves
+        return moves
+
+    def generate_legal_moves(self):
+        return self.filter_legal(self.pseudo_legal_moves(), self.get_checks_and_pins(int(self.turn)))
+
+    def has_legal_move(self):  # stops at the first legal move instead of generating all of them
+        if self.get_key() == self.cached_key:
+            return bool(self.cached_moves)
+
+        color = int(self.turn)
+        checks = self.get_checks_and_pins(color)
+        # in double check only the king can move,
+        # castling is never the only legal move, the king can always make the first step of it
+        for start in [self.get_king_pos(color)] if len(checks[0]) > 1 else range(ROWS * COLS):
+            if self.pieces[start] and self.colors[start] == color:
+                moves = []
+                self.add_piece_moves(start, color, moves)
+                if self.filter_legal(moves, checks):
+                    return True
+        return False
+
+    def get_moves_from(self, square):
+        return [move for move in self.legal_moves() if move & 63 == square]
+
+    def find_move(self, start, end, promotion=""):  # the legal move with its flags, None if there is no such move
+        key = encode_move(start, end, promotion)
+        for move in self.legal_moves():
+            if move & 0x7FFF == key:
+                return move
+
+    def is_capture(self, move):
+        return bool(move & CAPTURE)
+
+    def is_castling(self, move):
+        return bool(move & CASTLE)
+
+    def is_promotion(self, start, end):
+        return self.pieces[start] == "p" and end // COLS in (0, ROWS - 1)
+
+    def make_move(self, move):
+        start, end, promotion = move & 63, move >> 6 & 63, PROMOTION_LETTERS[move >> 12 & 7]
+        piece, color = self.get_piece(start)
+
+        # undo record: move, taken piece and its color, castle rights, en passant square, hash and halfmove clock
+        # before the move
+        castle_rights = self.get_castle_rights()
+        self.history.append((move, self.pieces[end], self.colors[end], castle_rights, self.en_passant, self.hash,
+                             self.halfmove_clock))
+
+        if piece == "p" or self.pieces[end]:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not color:
+            self.fullmove_number += 1
+
+        if move & EN_PASSANT:  # taking in passing
+            self.set_piece(end + (COLS if color else -COLS), "", 0)
+
+        if piece == "k":
+            self.forbid_castling(2, color)
+            if move & CASTLE:  # this moves rooks in castle
+                rook_start, rook_end = CASTLING_ROOKS[end]
+                self.set_piece(rook_end, "r", color)
+                self.set_piece(rook_start, "", 0)
+
+        # if a rook moves or gets taken, forbid castling on its side
+        for square in (start, end):
+            if square in CASTLING_SQUARES:
+                self.forbid_castling(CASTLING_SQUARES[square][1], CASTLING_SQUARES[square][0])
+
+        self.hash ^= CASTLE_KEYS[castle_rights] ^ CASTLE_KEYS[self.get_castle_rights()]
+
+        if self.en_passant is not None:
+            self.hash ^= EN_PASSANT_KEYS[self.en_passant % COLS]
+        self.en_passant = (start + end) // 2 if move & DOUBLE_PUSH else None
+        if self.en_passant is not None:
+            self.hash ^= EN_PASSANT_KEYS[self.en_passant % COLS]
+
+        self.set_piece(end, promotion or piece, color)
+        self.set_piece(start, "", 0)
+        self.switch_turn()
+
+    def unmake_move(self):
+        move, captured, captured_color, castle_rights, en_passant, position_hash, halfmove_clock = self.history.pop()
+        start, end = move & 63, move >> 6 & 63
+        self.switch_turn()
+        color = int(self.turn)
+        self.halfmove_clock = halfmove_clock
+        if not color:
+            self.fullmove_number -= 1
+        piece = "p" if move >> 12 & 7 else self.pieces[end]
+
+        self.set_piece(start, piece, color)
+        self.set_piece(end, captured, captured_color)
+
+        if move & EN_PASSANT:
+            self.set_piece(end + (COLS if color else -COLS), "p", 1 - color)
+
+        if move & CASTLE:
+            rook_start, rook_end = CASTLING_ROOKS[end]
+            self.set_piece(rook_start, "r", color)
+            self.set_piece(rook_end, "", 0)
+
+        self.set_castle_rights(castle_rights)
+        self.en_passant = en_passant
+        self.hash = position_hash
+
+    def is_repetition(self):
+        # same side to move every second ply, nothing before the last capture or pawn move can repeat
+        for record in self.history[-2:-self.halfmove_clock - 1:-2]:
+            if record[5] == self.hash:
+                return True
+        return False
+
+
+def encode_move(start, end, promotion="", flags=0):  # 0 is never a move, a8a8 can't be played
+    return start | end << 6 | PROMOTION_CODES[promotion] << 12 | flags
+
+
+def move_end(move):
+    return move >> 6 & 63
+
+
+def move_name(move):  # encode_move(52, 36) -> "e2e4"
+    return square_name(move & 63) + square_name(move >> 6 & 63) + PROMOTION_LETTERS[move >> 12 & 7]
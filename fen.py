@@ -0,0 +1,116 @@
+from engine import *
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def parse_placement(placement):  # [piece, color] of every square, ValueError if the board can't be played from
+    ranks = placement.split("/")
+    if len(ranks) != ROWS:
+        raise ValueError("FEN board has " + str(len(ranks)) + " ranks: " + placement)
+
+    squares = []
+    for rank in ranks:
+        width = 0
+        for char in rank:
+            if char in "12345678":
+                squares += [["", 0]] * int(char)
+                width += int(char)
+            elif char.lower() in "pnbrqk":
+                squares.append([char.lower(), 1 if char.isupper() else 0])
+                width += 1
+            else:
+                raise ValueError("unknown piece " + repr(char) + " in FEN board: " + placement)
+        if width != COLS:
+            raise ValueError("FEN rank " + repr(rank) + " has " + str(width) + " files")
+    # a pawn on the first or the last rank has no square in front of it, move generation would step off the board
+    if any(squares[square][0] == "p" for square in list(range(COLS)) + list(range((ROWS - 1) * COLS, ROWS * COLS))):
+        raise ValueError("FEN board has a pawn on the first or the last rank: " + placement)
+
+    for color in range(2):
+        if squares.count(["k", color]) != 1:
+            raise ValueError("FEN board needs exactly one " + ("white" if color else "black") + " king: " + placement)
+    return squares
+
+
+def load_fen(position, fen):  # sets every square of an existing position (or Game), nothing is changed if fen is bad
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError("FEN needs at least 4 fields: " + fen)
+    placement, turn, castling, en_passant = fields[:4]
+
+    squares = parse_placement(placement)
+    if turn not in ("w", "b"):
+        raise ValueError("FEN side to move has to be w or b: " + fen)
+    if castling != "-" and any(char not in "KQkq" for char in castling):
+        raise ValueError("bad FEN castling rights: " + fen)
+    if en_passant != "-":
+        # the square behind a pawn of the side not to move that has just moved two squares,
+        # make_move takes that pawn off the board without looking
+        if len(en_passant) != 2 or en_passant[0] not in "abcdefgh" or en_passant[1] != ("6" if turn == "w" else "3"):
+            raise ValueError("bad FEN en passant square: " + fen)
+        square = name_to_square(en_passant)
+        pawn = square + COLS if turn == "w" else square - COLS
+        if squares[square] != ["", 0] or squares[pawn] != ["p", 0 if turn == "w" else 1]:
+            raise ValueError("FEN en passant square is not behind a pawn that has just moved: " + fen)
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+    # the side that has just moved can't be left in check, the king would be taken
+    board = Position()
+    for square in range(ROWS * COLS):
+        board.set_piece(square, *squares[square])
+    color = 0 if turn == "w" else 1
+    if board.is_attacked(1 - color, board.get_king_pos(color)):
+        raise ValueError("FEN side not to move is in check: " + fen)
+
+    for square in range(ROWS * COLS):
+        position.set_piece(square, *squares[square])
+
+    position.turn = turn == "w"
+    position.white_castle = [1 if "Q" in castling else 0, 1 if "K" in castling else 0]
+    position.black_castle = [1 if "q" in castling else 0, 1 if "k" in castling else 0]
+    # a right is only kept while the king and the rook are on their home squares,
+    # add_castling_moves does not look at the king square
+    for color in range(2):
+        castle = position.get_castle_options(color)
+        for i in range(2):
+            king_start, king_end, rook_start, rook_end, empty, safe = CASTLING[color][i]
+            if squares[king_start] != ["k", color] or squares[rook_start] != ["r", color]:
+                castle[i] = 0
+    position.en_passant = None if en_passant == "-" else name_to_square(en_passant)
+    position.halfmove_clock = halfmove_clock
+    position.fullmove_number = fullmove_number
+    position.history = []
+    position.calc_hash()
+    return position
+
+
+def position_from_fen(fen, position_class=Position):
+    return load_fen(position_class(), fen)
+
+
+def get_fen(position):
+    rows = []
+    for y in range(ROWS):
+        row = ""
+        empty = 0
+        for x in range(COLS):
+            piece, color = position.get_piece(to_square(x, y))
+            if piece:
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += piece.upper() if color else piece
+            else:
+                empty += 1
+        rows.append(row + str(empty) if empty else row)
+
+    castling = ("K" if position.white_castle[1] else "") + ("Q" if position.white_castle[0] else "") + \
+               ("k" if position.black_castle[1] else "") + ("q" if position.black_castle[0] else "")
+
+    return " ".join(["/".join(rows),
+                     "w" if position.turn else "b",
+                     castling or "-",
+                     "-" if position.en_passant is None else square_name(position.en_passant),
+                     str(position.halfmove_clock),
+                     str(position.fullmove_number)])
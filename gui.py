@@ -1,23 +1,45 @@
 import pygame
 import time
 
+TEXT_CACHE_SIZE = 1000  # rendered texts kept before the cache is emptied
+
+fonts = {}  # (face, size): font, SysFont is slow, so widgets of the same size share one
+rendered_texts = {}  # (font, text, color): surface
+
 def constrain(value, min, max):
     return max if value > max else (min if value < min else value)
 
+def get_font(face, size):
+    if (face, size) not in fonts:
+        fonts[face, size] = pygame.font.SysFont(face, size)
+    return fonts[face, size]
+
+def render_text(font, text, color):  # text is only rendered again when it or its color changes
+    key = (font, text, color)
+    if key not in rendered_texts:
+        if len(rendered_texts) >= TEXT_CACHE_SIZE:
+            rendered_texts.clear()
+        rendered_texts[key] = font.render(text, True, color)
+    return rendered_texts[key]
+
 class Box():
     def __init__(self, win, pos, size):
         self.width = size[0]
         self.height = size[1]
         self.bg = (255,255,255)
-        self.font = pygame.font.SysFont('arial', self.height - 8)
+        self.font = get_font('arial', self.height - 8)
         self.text_color = (0, 0, 0)
         self.title = ""
-        self.text = self.font.render(self.title, True, (0,0,0))
+        self.text = render_text(self.font, self.title, (0, 0, 0))
         self.x = pos[0]
         self.y = pos[1]
         self.win = win
         self.enabled = True
-        self.clickFlag = False
+        # mouse state, kept up to date by event_handler
+        self.mouse_pos = (0, 0)
+        self.pressed = False  # the left button went down over the box and is still held
+        self.hovered = False
+        self.clicked = False  # pressed and released over the box, until onClick reads it
         self.is_border = True
         self.border_color = (0, 0, 0)
         self.border_width = 1
@@ -42,14 +64,14 @@ class Box():
 
     def set_title(self, value):
         self.title = value
-        self.text = self.font.render(self.title, True, (0, 0, 0))
+        self.text = render_text(self.font, self.title, (0, 0, 0))
 
     def get_title(self):
         return self.title
 
     def set_font(self, value):
         self.font = value
-        self.text = self.font.render(self.title, True, (0, 0, 0))
+        self.text = render_text(self.font, self.title, (0, 0, 0))
 
     def get_font(self):
         return self.font
@@ -97,47 +119,34 @@ class Box():
         return self.border_width
 
 
+    def contains(self, pos):
+        return self.x < pos[0] < self.x + self.width and self.y < pos[1] < self.y + self.height
+
+    def event_handler(self, event):  # every event has to be passed here, the mouse is never polled
+        if event.type == pygame.MOUSEMOTION:
+            self.mouse_pos = event.pos
+            self.hovered = self.contains(event.pos)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.mouse_pos = event.pos
+            self.pressed = self.contains(event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.mouse_pos = event.pos
+            self.clicked = self.pressed and self.contains(event.pos)
+            self.pressed = False
+
     def onPress(self):
-        mouse_x = pygame.mouse.get_pos()[0]
-        mouse_y = pygame.mouse.get_pos()[1]
         if self.enabled:
-            if (pygame.mouse.get_pressed(3)[0] and
-                    mouse_x > self.x and
-                    mouse_x < self.x + self.width and
-                    mouse_y > self.y and
-                    mouse_y < self.y + self.height):
-                return True
-            return False
+            return self.pressed
 
     def onHover(self):
         if self.enabled:
-            mouse_x = pygame.mouse.get_pos()[0]
-            mouse_y = pygame.mouse.get_pos()[1]
-            if (mouse_x >= self.x and mouse_x <= self.x + self.width and
-                    mouse_y >= self.y and mouse_y <= self.y + self.height):
-                return True
-            return False
+            return self.hovered
 
     def onClick(self):
         if self.enabled:
-            mouse_x = pygame.mouse.get_pos()[0]
-            mouse_y = pygame.mouse.get_pos()[1]
-            if (pygame.mouse.get_pressed(3)[0] and
-                    mouse_x > self.x and
-                    mouse_x < self.x + self.width and
-                    mouse_y > self.y and
-                    mouse_y < self.y + self.height):
-                self.clickFlag = True
-
-            if not (pygame.mouse.get_pressed(3)[0] and
-                    mouse_x > self.x and
-                    mouse_x < self.x + self.width and
-                    mouse_y > self.y and
-                    mouse_y < self.y + self.height):
-                if self.clickFlag == True:
-                    self.clickFlag = False
-                    return True
-            return False
+            clicked = self.clicked
+            self.clicked = False
+            return clicked
 
 class Button(Box):
     def __init__(self, win, pos, size=(120, 25), title="", color=(207, 159, 27), color_active=(62, 39, 214)):
@@ -241,7 +250,7 @@ class FillBox(Box):
     def draw(self):
         if self.enabled:
             self.change_value()
-        self.text = self.font.render(self.title + " " + str(self.value), True, self.text_color)
+        self.text = render_text(self.font, self.title + " " + str(self.value), self.text_color)
         pygame.draw.rect(self.win, self.border_color, (self.x, self.y, self.width, self.height), self.border_width)
         if self.value < self.max:
             pygame.draw.rect(self.win, self.bg, (self.x, self.y, self.widthF, self.height))
@@ -252,7 +261,7 @@ class FillBox(Box):
     def change_value(self):
         if self.enabled:
             if self.onPress():
-                self.widthF = pygame.mouse.get_pos()[0] - self.x
+                self.widthF = self.mouse_pos[0] - self.x
                 if self.widthF > self.width:
                     self.widthF = self.width
                 elif self.widthF < 0:
@@ -277,12 +286,16 @@ class TextBox(Box):
         self.value = ""
         self.visible_text = ""
         self.chosen = False
-        self.text_render = self.font.render(self.visible_text, True, self.text_color)
+        self.text_render = render_text(self.font, self.visible_text, self.text_color)
         self.cursor = pygame.Rect(self.x, self.y, 0, self.height)
         self.cursor_pos = 0
 
 
     def event_handler(self, event):
+        Box.event_handler(self, event)
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and not self.pressed:
+            self.chosen = False  # clicked somewhere else
+
         if self.chosen:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_BACKSPACE:
@@ -297,14 +310,8 @@ class TextBox(Box):
                     self.value = self.value[:self.cursor_pos] + event.unicode + self.value[self.cursor_pos:]
                     self.cursor_pos += 1
 
-                self.visible_text = ""
-                counter = len(self.value) - 1
-                while self.font.size(self.visible_text)[0] < self.width - 13 and counter != -1:
-                    self.visible_text += self.value[counter]
-                    counter -= 1
-
-                self.visible_text = self.visible_text[::-1] # reverse a string
-                self.text_render = self.font.render(self.visible_text, True, self.text_color)
+                self.visible_text = self.fit_text()
+                self.text_render = render_text(self.font, self.visible_text, self.text_color)
 
                 self.cursor_pos = constrain(self.cursor_pos, 0, len(self.visible_text))
     def draw(self):
@@ -315,17 +322,36 @@ class TextBox(Box):
             self.cursor.width = self.font.size(self.visible_text[0:(len(self.visible_text) - (len(self.value) - self.cursor_pos))])[0]
             pygame.draw.rect(self.win, (0,0,0), (self.cursor.width + self.x + 3, self.y, 2, self.height))
 
-        if pygame.mouse.get_pressed(3)[0] and not self.onPress():
-            self.chosen = False
         if self.onClick():
             self.chosen = True
+
+    def fit_text(self):
+        # shortest end of the value at least as wide as the box (all of it if it is narrower).
+        # The length is doubled until the end is wide enough, then halved back, so only about log(n) strings
+        # no longer than twice the visible text are measured
+        def is_wide(length):
+            return self.font.size(self.value[len(self.value) - length:])[0] >= self.width - 13
+
+        high = 1
+        while high < len(self.value) and not is_wide(high):
+            high *= 2
+        high = min(high, len(self.value))
+        low = high // 2  # is_wide(low) is False, unless low is 0
+        while low < high:
+            middle = (low + high) // 2
+            if middle and is_wide(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return self.value[len(self.value) - high:]
+
     def get_value(self):
         return self.value
 
     def clear(self):
         self.value = ""
         self.visible_text = ""
-        self.text_render = self.font.render(self.visible_text, True, self.text_color)
+        self.text_render = render_text(self.font, self.visible_text, self.text_color)
 
     def is_chosen(self):
         return True if self.chosen else False
@@ -336,12 +362,12 @@ class Label(Box):
         self.set_text(text)
 
     def draw(self):
-        self.text = self.font.render(self.title, True, self.text_color)
+        self.text = render_text(self.font, self.title, self.text_color)
         self.win.blit(self.text, (self.x, self.y))
 
     def set_text(self, value):
         self.title = value
-        self.text = self.font.render(self.title, True, (0, 0, 0))
+        self.text = render_text(self.font, self.title, (0, 0, 0))
 
     def get_text(self):
         return self.title
@@ -0,0 +1,100 @@
+import argparse
+import sys
+import time
+from bitboard import *
+from fen import *
+
+# Standard perft positions with their known leaf counts for depth 1, 2, 3, ...
+POSITIONS = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("discovered check", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+BACKENDS = {"mailbox": Position, "bitboard": BitboardPosition}
+
+
+def perft(position, depth):
+    if depth <= 0:  # the position itself is the only leaf
+        return 1
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):  # leaf count under every root move, to find where two generators disagree
+    if depth <= 0:
+        return perft(position, depth)
+    total = 0
+    for move in position.legal_moves():
+        position.make_move(move)
+        nodes = perft(position, depth - 1)
+        position.unmake_move()
+        print(move_name(move), nodes)
+        total += nodes
+    return total
+
+
+def timed(function, position, depth):
+    start_time = time.time()
+    nodes = function(position, depth)
+    elapsed = time.time() - start_time
+    return nodes, elapsed, int(nodes / elapsed) if elapsed else 0
+
+
+def run_catalog(position_class, depth):
+    failed = 0
+    total_nodes = 0
+    total_time = 0
+    for name, fen, counts in POSITIONS:
+        position = position_from_fen(fen, position_class)
+        for d in range(1, min(depth, len(counts)) + 1):
+            nodes, elapsed, nps = timed(perft, position, d)
+            ok = nodes == counts[d - 1]
+            failed += not ok
+            total_nodes += nodes
+            total_time += elapsed
+            print(name, "depth", d, "nodes", nodes, "time", round(elapsed, 3), "nps", nps,
+                  "ok" if ok else "FAILED, expected " + str(counts[d - 1]))
+
+    print("total nodes", total_nodes, "time", round(total_time, 2), "nps", int(total_nodes / total_time) if total_time else 0)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the move generator and compare them with known values")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fen", help="position to count, the start position from fill_board if not given")
+    parser.add_argument("--divide", action="store_true", help="print the count under every root move")
+    parser.add_argument("--catalog", action="store_true", help="check every standard position up to --depth")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    args = parser.parse_args()
+
+    position_class = BACKENDS[args.backend]
+    if args.catalog:
+        sys.exit(1 if run_catalog(position_class, args.depth) else 0)
+
+    if args.fen:
+        position = position_from_fen(args.fen, position_class)
+    else:
+        position = position_class()
+        position.fill_board()
+
+    nodes, elapsed, nps = timed(divide if args.divide else perft, position, args.depth)
+    print("nodes", nodes, "time", round(elapsed, 3), "nps", nps)
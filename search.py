@@ -0,0 +1,302 @@
+import multiprocessing
+import time
+from tt import *
+from fen import *
+
+PIECE_VALUES = {"p": 100, "n": 320, "b": 330, "r": 500, "q": 900, "k": 0}
+MATE = 100000
+MATE_BOUND = MATE - 1000  # scores beyond it are mates, stored relative to the node in the table
+INFINITY = 1000000
+
+
+def calc_square_bonus(piece, square):  # from white's point of view, black uses the mirrored square
+    x, y = to_coords(square)
+    center = 7 - abs(2 * x - 7) // 2 - abs(2 * y - 7) // 2  # 1 in the corners, 7 in the middle
+    if piece == "p":
+        return (6 - y) * 8 + (center if 2 <= y <= 5 else 0)
+    if piece == "k":
+        return 10 if y == 7 and x in (1, 2, 6) else -2 * center  # hide the king until the board empties
+    if piece == "r":
+        return 15 if y == 1 else 0
+    return 3 * center
+
+
+PIECE_SQUARE_VALUES = [{piece: [PIECE_VALUES[piece] + calc_square_bonus(piece, square if color else square ^ 56)
+                                for square in range(ROWS * COLS)]
+                        for piece in PIECE_VALUES}
+                       for color in range(2)]  # [black, white][piece][square]
+
+
+def evaluate(position):  # from the point of view of the side to move
+    score = 0
+    for square in range(ROWS * COLS):
+        piece = position.pieces[square]
+        if piece:
+            if position.colors[square]:
+                score += PIECE_SQUARE_VALUES[1][piece][square]
+            else:
+                score -= PIECE_SQUARE_VALUES[0][piece][square]
+    return score if position.turn else -score
+
+
+def to_table_score(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def from_table_score(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class Search():
+    def __init__(self, position, time_limit=1.0, max_depth=64, verbose=False, table=None, root_moves=None,
+                 should_stop=None):
+        self.position = position
+        self.should_stop = should_stop  # polled with the clock, the search ends early once it returns True
+        self.table = table if table is not None else TranspositionTable()
+        self.root_moves = root_moves  # only these moves are searched at the root, all legal moves if None
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.verbose = verbose
+        self.nodes = 0
+        self.stopped = False
+        self.stop_time = 0
+        self.best_move = None
+        self.iteration_move = None  # best root move of the iteration in progress
+        self.best_score = 0
+        self.depth = 0
+        self.iterations = []  # [depth, score, move] of every finished iteration
+
+    def order_moves(self, moves, first=None):
+        # captures go first, the most valuable victim taken by the cheapest piece at the front
+        position = self.position
+        scores = {}
+        for move in moves:
+            if move == first:
+                scores[move] = INFINITY
+            elif move & CAPTURE:
+                victim = position.pieces[move >> 6 & 63] or "p"
+                scores[move] = 10 * PIECE_VALUES[victim] - PIECE_VALUES[position.pieces[move & 63]] + MATE
+            elif move >> 12 & 7:
+                scores[move] = PIECE_VALUES[PROMOTION_LETTERS[move >> 12 & 7]]
+            else:
+                scores[move] = 0
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+    def check_time(self):
+        if self.nodes & 1023 == 0 and (time.time() > self.stop_time or
+                                       (self.should_stop is not None and self.should_stop())):
+            self.stopped = True
+        return self.stopped
+
+    def quiescence(self, alpha, beta):
+        self.nodes += 1
+        if self.check_time():
+            return 0
+
+        score = evaluate(self.position)
+        if score >= beta:
+            return score
+        alpha = max(alpha, score)
+
+        for move in self.order_moves([move for move in self.position.legal_moves() if move & CAPTURE]):
+            self.position.make_move(move)
+            score = -self.quiescence(-beta, -alpha)
+            self.position.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def negamax(self, depth, alpha, beta, ply):
+        position = self.position
+        if ply and position.is_repetition():
+            return 0
+        if depth <= 0:
+            return self.quiescence(alpha, beta)
+
+        self.nodes += 1
+        if self.check_time():
+            return 0
+
+        entry = self.table.probe(position.hash)
+        table_move = None
+        if entry is not None:
+            entry_depth, flag, score, table_move = entry
+            score = from_table_score(score, ply)
+            if ply and entry_depth >= depth and (flag == EXACT or
+                                                 (flag == LOWER and score >= beta) or
+                                                 (flag == UPPER and score <= alpha)):
+                return score
+
+        moves = self.root_moves if ply == 0 and self.root_moves else position.legal_moves()
+        if not moves:
+            return -MATE + ply if position.is_check(int(position.turn)) else 0
+
+        if table_move is None and ply == 0:
+            table_move = self.best_move
+
+        start_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in self.order_moves(moves, table_move):
+            position.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if self.stopped:
+                return best_score
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if ply == 0:
+                    self.iteration_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= start_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(position.hash, depth, flag, to_table_score(best_score, ply), best_move)
+        return best_score
+
+    def iterative_deepening(self):
+        start_time = time.time()
+        self.stop_time = start_time + self.time_limit
+        self.table.new_search()
+        self.nodes = 0
+        self.stopped = False
+        self.best_move = None
+
+        for depth in range(1, self.max_depth + 1):
+            self.iteration_move = None
+            score = self.negamax(depth, -INFINITY, INFINITY, 0)
+
+            # an interrupted iteration is only trusted for the moves it finished looking at
+            if self.iteration_move is not None:
+                self.best_move = self.iteration_move
+                if not self.stopped:
+                    self.best_score = score
+                    self.depth = depth
+                    self.iterations.append([depth, score, self.best_move])
+
+            if self.verbose:
+                elapsed = time.time() - start_time
+                print("depth", depth, "score", self.best_score, "nodes", self.nodes,
+                      "nps", self.get_nps(elapsed), "time", round(elapsed, 2),
+                      "move", move_name(self.best_move) if self.best_move else "-")
+
+            if self.stopped or abs(self.best_score) > MATE - self.max_depth:
+                break
+
+        return self.best_move
+
+    def get_nps(self, elapsed):
+        return int(self.nodes / elapsed) if elapsed else 0
+
+
+def search_root_moves(job):  # runs in a worker process
+    fen, history, moves, time_limit, max_depth, table_size = job
+    position = position_from_fen(fen)
+    position.history = history  # undo records of the game, so repetitions are still seen
+    search = Search(position, time_limit, max_depth, table=TranspositionTable(table_size), root_moves=moves)
+    search.iterative_deepening()
+    return search.iterations, search.nodes
+
+
+def parallel_search(position, workers, time_limit=1.0, max_depth=64, table_size=16, verbose=False):
+    # root moves are dealt out to the workers, captures first so every worker gets some of them
+    moves = sorted(position.legal_moves(), key=position.is_capture, reverse=True)
+    if not moves:
+        return None, 0, 0, []
+    groups = [moves[i::workers] for i in range(workers) if moves[i::workers]]
+    fen = get_fen(position)
+    start_time = time.time()
+    with multiprocessing.Pool(len(groups)) as pool:
+        results = pool.map(search_root_moves, [(fen, position.history, group, time_limit, max_depth, table_size)
+                                               for group in groups])
+
+    stats = [[nodes, iterations[-1][0] if iterations else 0] for iterations, nodes in results]  # [nodes, depth]
+    if verbose:
+        elapsed = time.time() - start_time
+        for i, (nodes, worker_depth) in enumerate(stats):
+            print("worker", i, "nodes", nodes, "depth", worker_depth)
+
+    # scores can only be compared at a depth every worker has finished,
+    # a worker that did not finish its first iteration has nothing to compare
+    finished = [iterations for iterations, nodes in results if iterations]
+    if not finished:
+        if verbose:
+            print("no iteration finished, playing the first move")
+        return moves[0], 0, 0, stats
+    if len(finished) < len(results) and verbose:
+        print(len(results) - len(finished), "workers finished no iteration, their moves are left out")
+
+    depth = min(iterations[-1][0] for iterations in finished)
+    best_move = None
+    best_score = -INFINITY
+    for iterations in finished:
+        for iteration_depth, score, move in iterations:
+            if iteration_depth == depth and score > best_score:
+                best_score = score
+                best_move = move
+
+    if verbose:
+        nodes = sum(nodes for nodes, worker_depth in stats)
+        print("depth", depth, "score", best_score, "nodes", nodes, "nps", int(nodes / elapsed) if elapsed else 0,
+              "time", round(elapsed, 2), "move", move_name(best_move))
+    return best_move, best_score, depth, stats
+
+
+def find_best_move(position, time_limit=1.0, max_depth=64, verbose=False, table=None, workers=1):
+    if workers > 1:
+        if table is not None:
+            raise ValueError("every worker process makes its own table, a table can't be passed with workers > 1")
+        return parallel_search(position, workers, time_limit, max_depth, verbose=verbose)[0]
+    return Search(position.copy(), time_limit, max_depth, verbose, table).iterative_deepening()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search a position and print every iteration")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--time", type=float, default=5.0, help="seconds to think")
+    parser.add_argument("--depth", type=int, default=None, help="deepest iteration, 64 if not given")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in megabytes")
+    parser.add_argument("--workers", type=int, default=1, help="processes the root moves are split between")
+    parser.add_argument("--compare", action="store_true",
+                        help="search --depth without a time limit, on the workers and on one core, and print the speedup")
+    args = parser.parse_args()
+    if args.compare and args.depth is None:
+        parser.error("--compare needs --depth, both searches run to it with no time limit")
+    max_depth = 64 if args.depth is None else args.depth
+
+    position = position_from_fen(args.fen)
+    if args.workers == 1:
+        table = TranspositionTable(args.hash)
+        print("best move", move_name(find_best_move(position, args.time, max_depth, True, table)))
+        print("table usage", table.get_usage(), "per mille")
+    else:
+        # a run stopped by its time budget says nothing about speed, so a comparison times both runs to the same depth
+        time_limit = float("inf") if args.compare else args.time
+        start_time = time.time()
+        move, score, depth, stats = parallel_search(position, args.workers, time_limit, max_depth, args.hash, True)
+        elapsed = time.time() - start_time
+
+        if args.compare:
+            start_time = time.time()
+            Search(position, float("inf"), max_depth, table=TranspositionTable(args.hash)).iterative_deepening()
+            single_time = time.time() - start_time
+            print("one core", round(single_time, 2), "s, speedup", round(single_time / elapsed, 2))
@@ -0,0 +1,51 @@
+from array import array
+from engine import *
+
+# Transposition table kept in two flat arrays of 64-bit numbers, so its memory never grows during a search.
+# Every bucket has two slots: slot 0 keeps the deepest search of a position, slot 1 is always replaced.
+# An entry of an earlier search (generation) loses slot 0 to any new entry, so a table kept between moves
+# does not fill up with deep but stale positions.
+
+EXACT, LOWER, UPPER = 0, 1, 2  # score is exact, at least the score (beta cutoff), at most the score (fail low)
+
+ENTRY_SIZE = 16  # bytes: 8 for the key, 8 for the packed data
+BUCKET_SLOTS = 2
+SCORE_OFFSET = 1 << 21  # keeps stored scores positive
+SCORE_MASK = (1 << 22) - 1
+GENERATIONS = 256  # kept in the top 8 bits of the data, counts around
+MOVE_MASK = (1 << 20) - 1  # moves are stored as they are, 0 means no move
+
+
+class TranspositionTable():
+    def __init__(self, size_mb=16):
+        self.buckets = max(1, size_mb * 1024 * 1024 // (ENTRY_SIZE * BUCKET_SLOTS))
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        self.keys = array("Q", [0]) * (self.buckets * BUCKET_SLOTS)
+        self.data = array("Q", [0]) * (self.buckets * BUCKET_SLOTS)
+
+    def new_search(self):  # called when a search starts, older entries become replaceable
+        self.generation = (self.generation + 1) % GENERATIONS
+
+    def probe(self, key):  # [depth, flag, score, move] or None
+        slot = key % self.buckets * BUCKET_SLOTS
+        for i in range(slot, slot + BUCKET_SLOTS):
+            if self.keys[i] == key:
+                data = self.data[i]
+                return [data >> 24 & 255, data >> 20 & 3, (data >> 32 & SCORE_MASK) - SCORE_OFFSET, data & MOVE_MASK or None]
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        slot = key % self.buckets * BUCKET_SLOTS
+        data = self.data[slot]
+        if self.keys[slot] != key and depth < data >> 24 & 255 and data >> 56 == self.generation:
+            slot += 1  # the deeper entry of this search stays, the new one goes to the always-replace slot
+
+        self.keys[slot] = key
+        self.data[slot] = self.generation << 56 | (score + SCORE_OFFSET) << 32 | depth << 24 | flag << 20 | (move or 0)
+
+    def get_usage(self):  # share of filled slots in the first thousand, in per mille
+        sample = min(1000, len(self.keys))
+        return sum(1 for i in range(sample) if self.keys[i]) * 1000 // sample
@@ -0,0 +1,72 @@
+import multiprocessing
+import queue
+import traceback
+from search import *
+
+# Runs searches in a separate process so the pygame loop keeps its frame rate while the computer thinks.
+# Jobs are numbered; stopping a job means raising stop_id to its number, which the search polls.
+
+
+def run_worker(jobs, results, stop_id, table_size):
+    table = TranspositionTable(table_size)  # lives as long as the process, so it is reused between moves
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        job_id, position, time_limit, max_depth = job
+        try:
+            results.put([job_id] + search_job(position, time_limit, max_depth, table,
+                                              lambda: stop_id.value >= job_id))
+        except Exception:  # the job still gets an answer and the process stays up for the next one
+            traceback.print_exc()
+            results.put([job_id, None, 0, 0, 0])
+
+
+def search_job(position, time_limit, max_depth, table, should_stop):  # [move, score, depth, nodes]
+    if not position.has_legal_move():  # checkmate or stalemate, there is no move to look for
+        return [None, -MATE if position.is_check(int(position.turn)) else 0, 0, 0]
+
+    search = Search(position, time_limit, max_depth, table=table, should_stop=should_stop)
+    move = search.iterative_deepening() or position.legal_moves()[0]  # stopped before the first move was searched
+    return [move, search.best_score, search.depth, search.nodes]
+
+
+class SearchWorker():
+    def __init__(self, table_size=16):
+        self.jobs = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.stop_id = multiprocessing.RawValue("i", 0)
+        self.job_id = 0
+        self.process = multiprocessing.Process(target=run_worker,
+                                               args=(self.jobs, self.results, self.stop_id, table_size),
+                                               daemon=True)
+        self.process.start()
+
+    def start(self, position, time_limit=1.0, max_depth=64):  # returns the job number used by the other methods
+        self.job_id += 1
+        # a plain Position with the undo records goes to the worker, so it still sees repetitions
+        job_position = position_from_fen(get_fen(position))
+        job_position.history = position.history[:]
+        self.jobs.put((self.job_id, job_position, time_limit, max_depth))
+        return self.job_id
+
+    def poll(self, job_id):  # [move, score, depth, nodes] once the job is done, None while it is thinking
+        # move is None when the position has no legal move or the search failed
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if result[0] == job_id:  # results of cancelled jobs are dropped
+                return result[1:]
+
+    def move_now(self, job_id):  # the job finishes with the best move found so far
+        self.stop_id.value = max(self.stop_id.value, job_id)
+
+    def cancel(self, job_id):  # same as move_now, but poll will never be called for this job
+        self.move_now(job_id)
+
+    def close(self):
+        self.jobs.put(None)
+        self.process.join(1)
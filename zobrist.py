@@ -0,0 +1,11 @@
+import random
+from constants import *
+
+# Random keys for Zobrist hashing. The seed is fixed so every process computes the same hash for a position.
+generator = random.Random(1207)
+
+PIECE_KEYS = [{piece: [generator.getrandbits(64) for square in range(ROWS * COLS)] for piece in "pnbrqk"}
+              for color in range(2)]  # [black, white][piece][square]
+TURN_KEY = generator.getrandbits(64)  # in the hash while white is to move
+CASTLE_KEYS = [generator.getrandbits(64) for rights in range(16)]  # indexed by Position.get_castle_rights()
+EN_PASSANT_KEYS = [generator.getrandbits(64) for x in range(COLS)]  # indexed by the file of the en passant square